@@ -0,0 +1,98 @@
+"""
+Logging setup shared by server_run.py and clientC.py.
+
+All records go through a queue to a background writer thread, so the
+network threads never wait on the console. Per-message payload logs are
+emitted at DEBUG level behind isEnabledFor() checks and a Sampler, which
+means the default INFO level does no formatting work per message.
+
+The level and sampling rate default to the ARENA_LOG_LEVEL and
+ARENA_LOG_SAMPLE environment variables.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+DEFAULT_LEVEL = os.environ.get("ARENA_LOG_LEVEL", "INFO")
+DEFAULT_SAMPLE = int(os.environ.get("ARENA_LOG_SAMPLE", "1"))
+
+_listener = None
+_listener_pid = None  # Process that started _listener; forked children need their own
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves all formatting to the writer thread."""
+
+    def prepare(self, record):
+        return record
+
+
+class Pretty:
+    """
+    Lazy pretty-printed JSON; only rendered if the record is written.
+
+    The data is copied when the log call is made: the writer thread renders
+    it later, while the caller may already be changing the original.
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = copy.deepcopy(data)
+
+    def __str__(self):
+        return json.dumps(self.data, indent=4, ensure_ascii=False, default=str)
+
+
+class Sampler:
+    """
+    Let one out of every `every` calls through.
+
+    Args:
+        every (int): Sampling period; 1 logs everything.
+    """
+    __slots__ = ("every", "count")
+
+    def __init__(self, every=None):
+        self.every = max(1, every or DEFAULT_SAMPLE)
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        if self.count >= self.every:
+            self.count = 0
+            return True
+        return False
+
+
+def setup_logging(level=None):
+    """
+    Route the root logger through a background writer thread.
+
+    Calling it again only changes the level, except in a forked child
+    process, which gets its own writer thread.
+
+    Args:
+        level (str|int|None): Log level name or number, defaults to DEFAULT_LEVEL.
+
+    Returns:
+        None
+    """
+    global _listener, _listener_pid
+    root = logging.getLogger()
+    root.setLevel(level or DEFAULT_LEVEL)
+    if _listener is not None and _listener_pid == os.getpid():
+        return
+
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    root.handlers[:] = [_DeferredQueueHandler(log_queue)]
+    _listener.start()
+    _listener_pid = os.getpid()
+    atexit.register(_listener.stop)
@@ -0,0 +1,413 @@
+"""
+Headless bot client and load generator for server_run.py.
+
+Bots speak the same protocol as clientC.py (JSON login offering framed
+messages, then movement with input sequence numbers, attacks and snapshot
+acks) but need neither Tk nor PIL, so one asyncio process can drive
+thousands of them:
+
+    python bot_client.py --bots 1000 --duration 60
+
+Each bot queues for a match, random-walks across the arena and casts its
+skills as their cooldowns allow; when the match ends it reconnects and
+queues again. Every REPORT_INTERVAL seconds the generator logs how many bots
+are connected and playing, the message rates in both directions and the
+input latency: the time from sending a movement input until a snapshot
+echoes its input_seq, i.e. until the server has applied it.
+
+Bots keep everything on TCP; they never ask for the UDP movement channel.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import arena_log
+import hero_table
+import protocol
+from pathlib import Path
+
+# =========================
+# Bot configuration
+# =========================
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 1212  # Default port for the server, can be changed if needed
+MOVE_INTERVAL = 1 / 30  # Seconds between movement inputs, one per server tick like clientC
+TURN_CHANCE = 0.05  # Chance per movement input to pick a new direction
+ATTACK_INTERVAL = 1.0  # Seconds between attempts to cast a skill that is off cooldown
+ARENA_BOUNDS = (50, 750, 50, 350)  # Random walk limits: x min, x max, y min, y max
+RAMP_RATE = 200  # Bots connected per second, so the server is not hit by one burst
+RECONNECT_DELAY = 1.0  # Seconds a bot waits after a failed connection
+REPORT_INTERVAL = 5.0  # Seconds between load reports
+READ_SIZE = 65536  # Bytes per socket read
+
+log = logging.getLogger("arena.bot")
+
+
+def load_heroes():
+    """
+    Load the hero table the bots pick their heroes from.
+
+    Returns:
+        hero_table.HeroTable: All heroes, indexed by id and by name.
+    """
+    return hero_table.load(str(Path(__file__).resolve().with_name('property.json')))
+
+
+class LoadStats:
+    """
+    Counters shared by all bots of a load run.
+
+    Message counters only grow; report() turns them into rates. Latency
+    samples are collected between two reports and then discarded.
+    """
+    __slots__ = ("connected", "playing", "matches", "sent", "received", "bytes_in", "errors", "latencies")
+
+    def __init__(self):
+        self.connected = 0  # Open connections
+        self.playing = 0  # Bots inside a running match
+        self.matches = 0  # Matches finished by a bot
+        self.sent = 0  # Messages sent
+        self.received = 0  # Messages received
+        self.bytes_in = 0  # Bytes received
+        self.errors = 0  # Failed or dropped connections
+        self.latencies = []  # Input latencies in seconds since the last report
+
+
+def percentile(samples, fraction):
+    """
+    Nearest-rank percentile of a sorted list.
+
+    Args:
+        samples (list[float]): Sorted samples, not empty.
+        fraction (float): Percentile as a fraction, e.g. 0.99.
+
+    Returns:
+        float: The sample at that rank.
+    """
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+class Bot:
+    """
+    One scripted player on one connection at a time.
+
+    play() runs a single match: log in, wait in the queue, move and attack
+    until one hero dies or the server closes the connection.
+    """
+    __slots__ = ("hero", "stats", "rng", "writer", "x", "y", "dx", "dy", "input_seq", "sent_at",
+                 "snapshot_seq", "ready_at", "in_match", "over")
+
+    def __init__(self, hero, stats, rng):
+        """
+        Args:
+            hero (hero_table.HeroStats): Hero the bot plays.
+            stats (LoadStats): Shared counters.
+            rng (random.Random): Random source for the bot's decisions.
+        """
+        self.hero = hero
+        self.stats = stats
+        self.rng = rng
+        self.writer = None
+        self.x = self.y = 0.0
+        self.dx = self.dy = 0
+        self.input_seq = 0
+        self.sent_at = {}  # input_seq -> send time of movement inputs not yet seen in a snapshot
+        self.snapshot_seq = 0
+        self.ready_at = []
+        self.in_match = False
+        self.over = False
+
+    def send(self, data):
+        """
+        Send one request frame.
+
+        Args:
+            data (dict): Request with 'opr_type' and REQUEST_FIELDS keys.
+
+        Returns:
+            None
+        """
+        data["hero_id"] = self.hero.id
+        if self.snapshot_seq:
+            data["ack"] = self.snapshot_seq  # Piggyback the snapshot ack
+        self.writer.write(protocol.encode_request(data))
+        self.stats.sent += 1
+
+    async def play(self, host, port):
+        """
+        Connect, play one match and disconnect.
+
+        Args:
+            host (str): Server address.
+            port (int): Server port.
+
+        Returns:
+            None
+        """
+        reader, self.writer = await asyncio.open_connection(host, port)
+        stats = self.stats
+        stats.connected += 1
+        self.in_match = self.over = False
+        self.snapshot_seq = 0
+        self.sent_at.clear()
+        actions = None
+        try:
+            login = {"opr_type": "0", "hero_name": self.hero.name, "hero_id": self.hero.id,
+                     "wire": protocol.WIRE_VERSION}
+            self.writer.write(json.dumps(login).encode('utf-8'))
+            stats.sent += 1
+            decoder = protocol.MessageDecoder()
+            actions = asyncio.create_task(self.act())
+            while not self.over:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    if not self.over:
+                        stats.errors += 1  # Dropped by the server before the match ended
+                    break
+                stats.bytes_in += len(data)
+                for message in decoder.feed(data):
+                    stats.received += 1
+                    self.handle(message)
+        finally:
+            if actions is not None:
+                actions.cancel()
+            if self.in_match:
+                stats.playing -= 1
+            stats.connected -= 1
+            self.writer.close()
+
+    def handle(self, message):
+        """
+        Apply one server message to the bot's state.
+
+        Args:
+            message (dict): Decoded server response.
+
+        Returns:
+            None
+        """
+        resp_type = message.get('s_resp_type')
+        if resp_type == "0":  # Match found
+            self.in_match = True
+            self.stats.playing += 1
+            left, right, top, bottom = ARENA_BOUNDS
+            self.x, self.y = self.rng.uniform(left, right), self.rng.uniform(top, bottom)
+            self.ready_at = [0.0] * self.hero.skill_count
+            return
+        if resp_type not in ("1", "2"):
+            return  # Queue updates and the UDP offer need no answer
+
+        seq = message.get('seq')
+        if seq:
+            self.snapshot_seq = int(seq)
+        input_seq = message.get('s_input_seq')
+        if input_seq:
+            now = time.monotonic()
+            applied = int(input_seq)
+            sent_at = self.sent_at
+            for pending in [s for s in sent_at if s <= applied]:
+                if pending == applied:
+                    self.stats.latencies.append(now - sent_at[pending])
+                del sent_at[pending]
+        if message.get('s_hero1_health') == "0" or message.get('s_hero2_health') == "0":
+            self.over = True
+            if message.get('s_hero1_health') == "0":
+                self.stats.matches += 1  # Counted by the losing bot only, so each match once
+
+    async def act(self):
+        """
+        Send movement inputs and attacks while the bot is in a match.
+
+        Returns:
+            None
+        """
+        rng = self.rng
+        left, right, top, bottom = ARENA_BOUNDS
+        step = self.hero.movement_speed * MOVE_INTERVAL
+        next_attack = time.monotonic() + rng.uniform(0, ATTACK_INTERVAL)
+        while True:
+            await asyncio.sleep(MOVE_INTERVAL)
+            if not self.in_match or self.over:
+                continue
+            if rng.random() < TURN_CHANCE or not (self.dx or self.dy):
+                self.dx, self.dy = rng.choice(((-1, 0), (1, 0), (0, -1), (0, 1)))
+            self.x = min(right, max(left, self.x + self.dx * step))
+            self.y = min(bottom, max(top, self.y + self.dy * step))
+            if self.x in (left, right) or self.y in (top, bottom):
+                self.dx, self.dy = -self.dx, -self.dy  # Bounce off the arena edge
+
+            now = time.monotonic()
+            self.input_seq += 1
+            self.sent_at[self.input_seq] = now
+            self.send({"opr_type": "1", "hero_x": int(self.x), "hero_y": int(self.y),
+                       "input_seq": self.input_seq})
+
+            if now >= next_attack:
+                next_attack = now + ATTACK_INTERVAL
+                ready = [i for i, at in enumerate(self.ready_at) if at <= now]
+                if ready:
+                    skill_index = rng.choice(ready)
+                    self.ready_at[skill_index] = now + self.hero.cooldown[skill_index]
+                    self.send({"opr_type": "2", "hero_skill": skill_index})
+
+
+async def run_bot(bot, host, port, deadline):
+    """
+    Play matches back to back until the deadline.
+
+    Args:
+        bot (Bot): Bot to run.
+        host (str): Server address.
+        port (int): Server port.
+        deadline (float): time.monotonic() value at which the run ends.
+
+    Returns:
+        None
+    """
+    while time.monotonic() < deadline:
+        try:
+            await bot.play(host, port)
+        except (OSError, ValueError) as e:
+            bot.stats.errors += 1
+            log.debug("Bot %s: %s", bot.hero.name, e)
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+async def report(stats, interval=REPORT_INTERVAL):
+    """
+    Log message rates and input latency of the load run periodically.
+
+    Args:
+        stats (LoadStats): Shared counters.
+        interval (float): Seconds between reports.
+
+    Returns:
+        None
+    """
+    last = time.monotonic()
+    last_sent, last_received, last_bytes = stats.sent, stats.received, stats.bytes_in
+    while True:
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        elapsed = now - last
+        latencies = sorted(stats.latencies)
+        stats.latencies.clear()
+        if latencies:
+            latency = (f"input latency p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+                       f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+        else:
+            latency = "no input latency samples"
+        log.info("%d bots connected, %d playing, %d matches done | sent %.0f msg/s, received %.0f msg/s "
+                 "(%.1f KiB/s) | %s | %d errors",
+                 stats.connected, stats.playing, stats.matches, (stats.sent - last_sent) / elapsed,
+                 (stats.received - last_received) / elapsed, (stats.bytes_in - last_bytes) / elapsed / 1024,
+                 latency, stats.errors)
+        last = now
+        last_sent, last_received, last_bytes = stats.sent, stats.received, stats.bytes_in
+
+
+def raise_file_limit(needed):
+    """
+    Raise the soft open-file limit so every bot can have its socket.
+
+    Args:
+        needed (int): File descriptors the run needs.
+
+    Returns:
+        None
+    """
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY or soft >= needed:
+        return
+    target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    if target < needed:
+        log.warning("Open file limit is %d, fewer than the %d sockets needed; raise it with ulimit -n",
+                    target, needed)
+
+
+async def run_load(bots, host=SERVER_HOST, port=SERVER_PORT, duration=60.0, ramp=RAMP_RATE, hero_name=None,
+                   seed=None):
+    """
+    Run a load test: start bots at the ramp rate and let them play until the duration is over.
+
+    Args:
+        bots (int): Number of bots.
+        host (str): Server address.
+        port (int): Server port.
+        duration (float): Seconds from the first bot to the end of the run.
+        ramp (float): Bots started per second.
+        hero_name (str|None): Hero every bot plays, None picks one at random per bot.
+        seed (int|None): Seed for the bots' decisions, for repeatable runs.
+
+    Returns:
+        LoadStats: Counters at the end of the run.
+    """
+    heroes = load_heroes()
+    if hero_name is not None and hero_name not in heroes:
+        raise ValueError(f"Unknown hero: {hero_name}")
+    names = heroes.names()
+    rng = random.Random(seed)
+    stats = LoadStats()
+    deadline = time.monotonic() + duration
+    reporter = asyncio.create_task(report(stats))
+    tasks = []
+    log.info("Starting %d bots against %s:%d at %.0f bots/s for %.0f s", bots, host, port, ramp, duration)
+    try:
+        for _ in range(bots):
+            hero = heroes.by_name(hero_name or rng.choice(names))
+            bot = Bot(hero, stats, random.Random(rng.getrandbits(64)))
+            tasks.append(asyncio.create_task(run_bot(bot, host, port, deadline)))
+            if time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(1 / ramp)
+        await asyncio.wait(tasks, timeout=max(0.0, deadline - time.monotonic()))
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        reporter.cancel()
+    log.info("Load run finished: %d messages sent, %d received, %d matches done, %d errors",
+             stats.sent, stats.received, stats.matches, stats.errors)
+    return stats
+
+
+def parse_args(argv=None):
+    """
+    Parse command line options.
+
+    Args:
+        argv (list[str]|None): Arguments, defaults to sys.argv[1:].
+
+    Returns:
+        argparse.Namespace: Parsed options.
+    """
+    parser = argparse.ArgumentParser(description="Headless bot players and load generator for the arena server")
+    parser.add_argument("--bots", type=int, default=100, help="number of bot players (default: %(default)s)")
+    parser.add_argument("--host", default=SERVER_HOST, help="server address (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="server port (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=60.0,
+                        help="seconds to run, matches still running at the end are dropped (default: %(default)s)")
+    parser.add_argument("--ramp", type=float, default=RAMP_RATE,
+                        help="bots connected per second (default: %(default)s)")
+    parser.add_argument("--hero", default=None, help="hero every bot plays (default: a random hero per bot)")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for repeatable runs")
+    parser.add_argument("--log-level", default=arena_log.DEFAULT_LEVEL,
+                        help="DEBUG, INFO, WARNING or ERROR (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    arena_log.setup_logging(args.log_level)
+    raise_file_limit(args.bots + 64)
+    try:
+        asyncio.run(run_load(args.bots, args.host, args.port, args.duration, args.ramp, args.hero, args.seed))
+    except KeyboardInterrupt:
+        log.info("Load run stopped.")
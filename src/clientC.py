@@ -1,11 +1,20 @@
+import argparse
 import socket
 import json
+import logging
+from collections import OrderedDict, deque
+import queue
 import threading
+import time
 import tkinter as tk
 import random
 from pathlib import Path
 import os, sys
 from pathlib import Path
+import arena_log
+import hero_table
+import protocol
+from arena_log import Pretty
 
 
 try:
@@ -23,6 +32,12 @@ SPRITE_EXT = ".png"  # 贴图后缀
 SPRITE_SIZE = (64, 64)  # 统一缩放尺寸（需要 PIL 才能缩放）
 SPRITE_ANCHOR = "center"  # 图像锚点（中心）
 SPRITE_REFS = []  # 防止贴图被 GC 回收
+SPRITE_CACHE_SIZE = 64  # Decoded sprites kept in memory, least recently used are evicted
+_sprite_cache = OrderedDict()  # (hero name, size) -> decoded PIL image, shared with the preload thread
+_photo_cache = OrderedDict()  # (hero name, size) -> Tk image, UI thread only
+_sprite_lock = threading.Lock()
+SHEET_SUFFIX = "_sheet"  # assets/<hero>_sheet.png: square animation frames side by side (needs PIL)
+ANIMATION_FPS = 8  # Frames per second of hero animations
 
 # =========================
 # Server configuration 修改贴图
@@ -42,6 +57,13 @@ HOW_TO_PLAY_TEXT = (
     "• Watch both your own and the opponent's HP.\n"
 )
 
+# =========================
+# Input configuration
+# =========================
+FRAME_RATE = 60  # Held keys are sampled once per frame
+MOVE_SEND_INTERVAL = 1 / 30  # At most one movement message per server tick
+ARROW_KEYS = {"Left": (-1, 0), "Right": (1, 0), "Up": (0, -1), "Down": (0, 1)}
+
 # 放到文件顶部附近（clientC.py / server_run.py 都建议加）
 def resource_path(rel_path: str) -> str:
     """兼容 PyInstaller 的资源定位：先取 _MEIPASS，再退回脚本目录"""
@@ -49,20 +71,66 @@ def resource_path(rel_path: str) -> str:
     return str(Path(base) / rel_path)
 
 
-def _sprite_path_for(hero_name: str) -> str:
+def _sprite_path_for(hero_name: str, size=None, scaled_only=False) -> str:
     """
     Build a path to sprite file from hero name (lowercase, remove spaces/hyphens).
+
+    With a size, a pre-scaled sprite from build_scaled_sprites() is preferred
+    when it exists.
     """
     safe = hero_name.lower().replace(" ", "").replace("-", "_")
     #return str(Path(SPRITE_DIR) / f"{safe}{SPRITE_EXT}")
+    if size:
+        scaled = resource_path(str(Path("assets") / f"{safe}_{size[0]}x{size[1]}{SPRITE_EXT}"))
+        if scaled_only or Path(scaled).exists():
+            return scaled
     path = resource_path(str(Path("assets") / f"{safe}{SPRITE_EXT}"))
     return path
 
 
+def _cache_put(cache, key, value):
+    """Insert into an LRU cache, evicting beyond SPRITE_CACHE_SIZE."""
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > SPRITE_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def decode_sprite(hero_name: str, size=SPRITE_SIZE):
+    """
+    Decode and scale a sprite with PIL, through the shared sprite cache.
+
+    Safe to call from any thread: it creates no Tk objects.
+
+    Args:
+        hero_name (str): Hero name, e.g., 'zhaoyun'.
+        size (tuple[int,int]|None): (w,h) to scale to, None for the original size.
+
+    Returns:
+        PIL.Image.Image: RGBA image.
+    """
+    key = (hero_name, tuple(size) if size else None)
+    with _sprite_lock:
+        img = _sprite_cache.get(key)
+        if img is not None:
+            _sprite_cache.move_to_end(key)
+            return img
+    img = Image.open(_sprite_path_for(hero_name, size)).convert("RGBA")
+    if size and img.size != tuple(size):
+        img = img.resize(size, Image.LANCZOS)  # No pre-scaled sprite for this size
+    with _sprite_lock:
+        _cache_put(_sprite_cache, key, img)
+    return img
+
+
 def load_sprite_image(hero_name: str, size=SPRITE_SIZE):
     """
     Load a sprite (PNG) for the given hero name.
 
+    Images are cached per hero and size; callers that keep showing an image
+    must still hold a reference (SPRITE_REFS), since an evicted entry is
+    otherwise garbage collected.
+
     Args:
         hero_name (str): Hero name, e.g., 'zhaoyun'.
         size (tuple[int,int]): (w,h) to scale to when PIL is available.
@@ -70,17 +138,142 @@ def load_sprite_image(hero_name: str, size=SPRITE_SIZE):
     Returns:
         object: A Tk-compatible image object (PhotoImage or ImageTk.PhotoImage).
     """
-    path = _sprite_path_for(hero_name)
+    key = (hero_name, tuple(size) if size else None)
+    photo = _photo_cache.get(key)
+    if photo is not None:
+        _photo_cache.move_to_end(key)
+        return photo
     if PIL_AVAILABLE:
-        img = Image.open(path).convert("RGBA")
-        if size:
-            img = img.resize(size, Image.LANCZOS)
-        return ImageTk.PhotoImage(img)
+        photo = ImageTk.PhotoImage(decode_sprite(hero_name, size))
     else:
         # Tk 8.6 一般支持 PNG；若你的 Tk 版本不支持 PNG，请安装 Pillow
         import tkinter as tk
-        return tk.PhotoImage(file=path)
+        photo = tk.PhotoImage(file=_sprite_path_for(hero_name, size))
+    _cache_put(_photo_cache, key, photo)
+    return photo
+
+
+def decode_sheet(hero_name: str, size=SPRITE_SIZE):
+    """
+    Slice a hero's sprite sheet into scaled frames, through the sprite cache.
+
+    The sheet is a row of square frames, so the frame count is its width
+    divided by its height. Safe to call from any thread.
+
+    Args:
+        hero_name (str): Hero name, e.g., 'zhaoyun'.
+        size (tuple[int,int]): (w,h) of each frame.
+
+    Returns:
+        list[PIL.Image.Image]: RGBA frames in order.
+    """
+    key = (hero_name, tuple(size), SHEET_SUFFIX)
+    with _sprite_lock:
+        frames = _sprite_cache.get(key)
+        if frames is not None:
+            _sprite_cache.move_to_end(key)
+            return frames
+    path = Path(_sprite_path_for(hero_name))
+    sheet = Image.open(path.with_name(path.stem + SHEET_SUFFIX + SPRITE_EXT)).convert("RGBA")
+    side = sheet.height
+    frames = [sheet.crop((i * side, 0, (i + 1) * side, side)).resize(size, Image.LANCZOS)
+              for i in range(max(1, sheet.width // side))]
+    with _sprite_lock:
+        _cache_put(_sprite_cache, key, frames)
+    return frames
+
+
+def load_animation_frames(hero_name: str, size=SPRITE_SIZE):
+    """
+    Tk frames of a hero's animation, shared by every item that shows it.
+
+    Args:
+        hero_name (str): Hero name, e.g., 'zhaoyun'.
+        size (tuple[int,int]): (w,h) of each frame.
+
+    Returns:
+        list|None: ImageTk.PhotoImage frames, None if the hero has no sprite
+        sheet or PIL is missing.
+    """
+    if not PIL_AVAILABLE:
+        return None
+    key = (hero_name, tuple(size), SHEET_SUFFIX)
+    frames = _photo_cache.get(key)
+    if frames is None:
+        try:
+            frames = [ImageTk.PhotoImage(frame) for frame in decode_sheet(hero_name, size)]
+        except OSError:
+            frames = []  # No sheet: remember that, static sprites are used instead
+        _cache_put(_photo_cache, key, frames)
+    else:
+        _photo_cache.move_to_end(key)
+    return frames or None
+
+
+def preload_sprites(hero_names, size=SPRITE_SIZE):
+    """
+    Decode the roster's sprites on a background thread.
 
+    Started before the welcome screen, so the sprites are decoded and scaled
+    while the player reads it. A hero with a sprite sheet only needs the
+    sheet, so each hero takes one cache entry and only the first
+    SPRITE_CACHE_SIZE heroes are loaded, more would just be evicted again.
+    Needs PIL (Tk images can only be created on the UI thread).
+
+    Args:
+        hero_names (list[str]): Hero names, e.g. heroes.names().
+        size (tuple[int,int]): (w,h) to scale to.
+
+    Returns:
+        threading.Thread|None: The preload thread, None without PIL.
+    """
+    if not PIL_AVAILABLE:
+        return None
+
+    def run():
+        loaded = 0
+        for name in hero_names[:SPRITE_CACHE_SIZE]:
+            for decode in (decode_sheet, decode_sprite):
+                try:
+                    decode(name, size)
+                    loaded += 1
+                    break  # The static sprite is only drawn when there is no sheet
+                except OSError:
+                    pass  # Missing sheet or sprite, the game falls back to a static sprite or a circle
+        log.debug("Preloaded %d sprites", loaded)
+
+    thread = threading.Thread(target=run, name="sprite-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def build_scaled_sprites(hero_names, size=SPRITE_SIZE):
+    """
+    Store pre-scaled copies of the sprites next to the originals.
+
+    load_sprite_image() picks them up, so no resize happens at runtime.
+    Re-run it after replacing a sprite.
+
+    Args:
+        hero_names (list[str]): Hero names, e.g. heroes.names().
+        size (tuple[int,int]): (w,h) to scale to.
+
+    Returns:
+        int: Number of sprites written.
+    """
+    written = 0
+    for name in hero_names:
+        try:
+            img = Image.open(_sprite_path_for(name)).convert("RGBA")
+        except OSError:
+            continue
+        img.resize(size, Image.LANCZOS).save(_sprite_path_for(name, size, scaled_only=True))
+        written += 1
+    return written
+
+
+log = logging.getLogger("arena.client")
+payload_sample = arena_log.Sampler()  # Sampling of per-message DEBUG payload logs
 
 # Global variables to store local and peer character data
 character_data = {}
@@ -88,9 +281,52 @@ peer_character_data = {}
 character = {}
 peer_character = {}
 canvas = None  # Declare canvas as a global variable
-
-send_buffer = ""
-recv_buffer = ""
+queue_text = None  # Canvas text showing the matchmaking queue status
+
+server_framed = False  # Set once the server answers with framed messages
+send_lock = threading.Lock()  # UI thread and receive thread both send
+ui_queue = queue.SimpleQueue()  # (receive time, server message) from the network threads to the Tk main loop
+
+# Snapshot acknowledgement (framed protocol only)
+ACK_INTERVAL = 0.1  # Seconds between standalone acks
+last_snapshot_seq = 0
+last_ack_time = 0.0
+STATE_FIELDS = ("s_hero1_health", "s_hero2_health", "s_hero1_x", "s_hero1_y", "s_hero2_x", "s_hero2_y",
+                "s_input_seq")  # Snapshot fields sent as deltas against a baseline snapshot
+SNAPSHOT_HISTORY = 64  # Rebuilt snapshots kept as baselines, as many as the server remembers
+snapshot_states = {}  # seq -> STATE_FIELDS values of a rebuilt snapshot
+snapshot_lock = threading.Lock()  # TCP and UDP receive threads both rebuild snapshots
+
+# Optional UDP channel for movement (framed protocol only)
+USE_UDP = True  # Ask the server for a UDP channel at login
+UDP_TYPES = ("1", "3")  # Requests sent over UDP once it works: movement and acks
+UDP_HELLO_INTERVAL = 0.5  # Seconds between bind attempts, and between idle acks
+UDP_HELLO_ATTEMPTS = 10  # Give up on the UDP channel after this many unanswered attempts
+POSITION_FIELDS = ("s_hero1_x", "s_hero1_y", "s_hero2_x", "s_hero2_y", "s_input_seq")
+udp_socket = None  # Connected UDP socket, None until the server offers a channel
+udp_state = {"token": 0, "send_seq": 0, "recv_seq": 0, "active": False, "unacked": False}
+
+# Input state shared by the key bindings and the frame loop (UI thread only)
+held_keys = set()
+input_state = {"last_frame": 0.0, "last_send": 0.0, "carry_x": 0.0, "carry_y": 0.0, "sent": None, "seq": 0,
+               "acked": None}
+pending_inputs = deque(maxlen=128)  # (input seq, dx, dy) sent but not yet applied by the server
+server_position = None  # Last own position reported by the server
+skill_ready_at = {}  # Skill index -> time.monotonic() from which it can be cast again
+
+# Rendering (UI thread only)
+INTERPOLATION_DELAY = 0.1  # Seconds the peer is drawn behind the newest snapshot, absorbs network jitter
+SNAPSHOT_BUFFER = 32  # Peer positions remembered for interpolation
+peer_samples = deque(maxlen=SNAPSHOT_BUFFER)  # (receive time, x, y) of the peer, oldest first
+rendered = {}  # Canvas item -> position it was last drawn at
+
+# Skill effects
+EFFECT_COLORS = ("red", "blue", "green", "purple", "orange", "yellow")
+EFFECT_SHAPES = ("polygon", "oval", "rectangle")  # Shape drawn by skill 0, 1 and 2
+EFFECT_DURATION = 0.5  # Seconds an effect stays visible
+MAX_EFFECTS = 8  # Concurrent effects per shape; casting more recycles the oldest
+effect_pool = None  # EffectPool of the battlefield canvas, created by start_client()
+animator = None  # Animator of the battlefield canvas, created by start_client()
 
 
 def shutdown_client(root=None, sock=None, exit_code=0):
@@ -221,7 +457,7 @@ def show_welcome_screen(heroes):
     Show a startup 'Home / How to Play' screen with instructions and hero selection.
 
     Args:
-        heroes (list[dict]): List of hero dicts loaded from JSON. Each dict must include 'name'.
+        heroes (hero_table.HeroTable): Compiled heroes.
 
     Returns:
         str: The selected hero name.
@@ -287,9 +523,10 @@ def show_welcome_screen(heroes):
     listbox.grid(row=0, column=0, sticky="nsew")
     scrollbar.grid(row=0, column=1, sticky="ns", padx=(6, 0))
 
-    for h in heroes:
-        listbox.insert(tk.END, h["name"])
-    if heroes:
+    names = heroes.names()  # Names only, heroes are decoded when chosen
+    for name in names:
+        listbox.insert(tk.END, name)
+    if names:
         listbox.select_set(0)
 
     selected_label = ttk.Label(group, text="Selected: (none)")
@@ -298,7 +535,7 @@ def show_welcome_screen(heroes):
     def on_select(_evt=None):
         idxs = listbox.curselection()
         if idxs:
-            selected_label.config(text=f"Selected: {heroes[idxs[0]]['name']}")
+            selected_label.config(text=f"Selected: {names[idxs[0]]}")
 
     listbox.bind("<<ListboxSelect>>", on_select)
     on_select()
@@ -312,7 +549,7 @@ def show_welcome_screen(heroes):
         if not idxs:
             messagebox.showwarning("Start Game", "Please choose a hero.")
             return
-        chosen["name"] = heroes[idxs[0]]["name"]
+        chosen["name"] = names[idxs[0]]
         root.destroy()
 
     ttk.Button(btns, text="Start Game", command=start_game).pack(side="left", padx=6)
@@ -327,15 +564,15 @@ def show_welcome_screen(heroes):
 
 def load_heroes():
     """
-    Load hero data from JSON file.
+    Load hero data from JSON file and compile it into a hero table.
+
+    The file is parsed once; later calls return the cached table until
+    property.json changes.
 
     Returns:
-        list: A list of hero dictionaries.
+        hero_table.HeroTable: All heroes, indexed by id and by name.
     """
-    # with open('property.json', 'r', encoding='utf-8') as base_file:
-    with open(resource_path('property.json'), 'r', encoding='utf-8') as base_file:
-        data = json.load(base_file)
-    return data['heroes']
+    return hero_table.load(resource_path('property.json'))
 
 
 def select_hero(heroes):
@@ -343,17 +580,18 @@ def select_hero(heroes):
     Prompt the user to select a hero.
 
     Args:
-        heroes (list): List of available heroes.
+        heroes (hero_table.HeroTable): Available heroes.
 
     Returns:
         str: The selected hero name.
     """
     print("Please choose a hero:")
-    for i, hero in enumerate(heroes):
-        print(f"{i + 1}. {hero['name']}")
+    names = heroes.names()
+    for i, name in enumerate(names):
+        print(f"{i + 1}. {name}")
     choice = int(input("Enter hero number: ")) - 1
-    if 0 <= choice < len(heroes):
-        return heroes[choice]['name']
+    if 0 <= choice < len(names):
+        return names[choice]
     else:
         print("Invalid choice, please try again.")
         return select_hero(heroes)
@@ -364,7 +602,7 @@ def select_hero_ui(heroes):
     Show a GUI dialog to select a hero.
 
     Args:
-        heroes (list[dict]): List of hero dicts loaded from JSON. Each hero dict contains at least a 'name' key.
+        heroes (hero_table.HeroTable): Compiled heroes.
 
     Returns:
         str: The selected hero name.
@@ -386,11 +624,12 @@ def select_hero_ui(heroes):
     ttk.Label(root, text="Please select a hero:", font=("Arial", 12)).pack(pady=10)
 
     # Listbox for hero names
-    listbox = tk.Listbox(root, height=min(10, len(heroes)))
-    for hero in heroes:
-        listbox.insert(tk.END, hero["name"])
+    names = heroes.names()
+    listbox = tk.Listbox(root, height=min(10, len(names)))
+    for name in names:
+        listbox.insert(tk.END, name)
     listbox.pack(fill="both", expand=True, padx=12)
-    if len(heroes) > 0:
+    if len(names) > 0:
         listbox.select_set(0)
 
     # Buttons
@@ -399,7 +638,7 @@ def select_hero_ui(heroes):
         if not idxs:
             messagebox.showwarning("Select Hero", "Please choose a hero.")
             return
-        selection["value"] = heroes[idxs[0]]["name"]
+        selection["value"] = names[idxs[0]]
         root.destroy()
 
     def on_cancel():
@@ -426,25 +665,21 @@ def load_character_data(hero_name):
         hero_name (str): The name of the chosen hero.
 
     Returns:
-        dict: Character data including name, position, health, and skills.
+        dict: Character data including name, position, health, and compiled stats.
     """
-    # with open('property.json', 'r', encoding='utf-8') as base_file:
-    with open(resource_path('property.json'), 'r', encoding='utf-8') as base_file:
-        data = json.load(base_file)
-
-    for hero in data['heroes']:
-        if hero['name'] == hero_name:
-            base_stats = hero
-            break
-    else:
+    try:
+        stats = load_heroes().by_name(hero_name)
+    except KeyError:
         raise ValueError(f"Hero '{hero_name}' not found")
 
     character_data.update({
-        "name": base_stats['name'],
+        "id": stats.id,
+        "name": stats.name,
         "x": 650,  # Initial X position
         "y": 100,  # Initial Y position
-        "health": base_stats['base_health'],
-        "skills": base_stats['skills']
+        "health": stats.base_health,
+        "movement_speed": stats.movement_speed,
+        "stats": stats
     })
 
     return character_data
@@ -461,6 +696,7 @@ def initialize_peer_character(peer_name):
         dict: Updated peer character data.
     """
     peer_character_data.update({
+        'id': None,  # Hero table id, known once the match starts
         'name': peer_name,
         'x': 150,  # Initial X position
         'y': 100,  # Initial Y position
@@ -470,24 +706,23 @@ def initialize_peer_character(peer_name):
     return character_data
 
 
-def send_data(client_socket, opr_type, hero_name, hero_x="", hero_y="", hero_skill="", peer_hero="", damage=0):
+def send_data(client_socket, opr_type, hero_name, hero_x="", hero_y="", hero_skill="", peer_hero="", input_seq=""):
     """
     Send data to the server.
 
     Args:
         client_socket (socket.socket): The client socket.
-        opr_type (str): Operation type ("0" login, "1" movement, "2" skill).
+        opr_type (str): Operation type ("0" login, "1" movement, "2" skill, "3" snapshot ack).
         hero_name (str): Name of the local hero.
         hero_x (str): X coordinate.
         hero_y (str): Y coordinate.
         hero_skill (str): Skill index.
         peer_hero (str): Peer hero name.
-        damage (int): Damage value.
+        input_seq (str): Sequence number of a movement input.
 
     Returns:
         None
     """
-    global send_buffer
     try:
         data = {
             "opr_type": opr_type,
@@ -496,13 +731,175 @@ def send_data(client_socket, opr_type, hero_name, hero_x="", hero_y="", hero_ski
             "hero_y": hero_y,
             "hero_skill": hero_skill,
             "peer_hero": peer_hero,
+            "input_seq": input_seq,
         }
-        json_data = json.dumps(data).encode('utf-8')
-        send_buffer += json_data.decode('utf-8')
-        client_socket.send(json_data)
-        print(f"Sent data: {json.dumps(data, indent=4, ensure_ascii=False)}")
+        if opr_type == "0":
+            data["wire"] = protocol.WIRE_VERSION  # Offer framed messages to the server
+            data["hero_id"] = character_data['id']
+            if USE_UDP:
+                data["udp"] = 1  # Ask for the UDP movement channel
+        if server_framed:
+            # After the login, heroes are referenced by their table ids
+            if opr_type != "0":
+                data["hero_name"], data["hero_id"] = "", character_data['id']
+            if peer_hero and peer_character_data.get('id') is not None:
+                data["peer_hero"], data["peer_id"] = "", peer_character_data['id']
+            if last_snapshot_seq:
+                data["ack"] = last_snapshot_seq  # Piggyback the snapshot ack
+            payload = protocol.encode_request(data)
+        else:
+            payload = json.dumps(data).encode('utf-8')
+        with send_lock:
+            if not (opr_type in UDP_TYPES and udp_state["active"] and send_datagram(payload)):
+                client_socket.sendall(payload)
+        if log.isEnabledFor(logging.DEBUG) and payload_sample():
+            log.debug("Sent data: %s", Pretty(data))
     except Exception as e:
-        print(f"Error sending data: {e}")
+        log.error("Error sending data: %s", e)
+
+
+def send_datagram(payload):
+    """
+    Send a request frame over the UDP channel; the caller holds send_lock.
+
+    Args:
+        payload (bytes): Request frame.
+
+    Returns:
+        bool: False if the UDP socket failed and the request must go over TCP.
+    """
+    udp_state["send_seq"] += 1
+    try:
+        udp_socket.send(protocol.pack_datagram(udp_state["token"], udp_state["send_seq"], payload))
+        return True
+    except OSError as e:
+        log.warning("UDP channel failed, back to TCP: %s", e)
+        udp_state["active"] = False
+        return False
+
+
+def open_udp_channel(client_socket, data):
+    """
+    Bind the UDP channel the server offered in a type "5" response.
+
+    Args:
+        client_socket (socket.socket): TCP connection to the server.
+        data (dict): Offer with the session token and UDP port.
+
+    Returns:
+        None
+    """
+    global udp_socket
+    if udp_socket is not None:
+        return
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect((client_socket.getpeername()[0], int(data['udp_port'])))
+    except OSError as e:
+        log.warning("Cannot open the UDP channel: %s", e)
+        sock.close()
+        return
+    udp_state["token"] = int(data['udp_token'], 16)
+    udp_socket = sock
+    threading.Thread(target=receive_udp, args=(client_socket,), daemon=True).start()
+
+
+def send_udp_hello():
+    """Send an ack over UDP so the server learns the channel's address."""
+    with send_lock:
+        send_datagram(protocol.encode_request({"opr_type": "3", "hero_id": character_data['id'],
+                                               "ack": last_snapshot_seq}))
+
+
+def receive_udp(client_socket):
+    """
+    Receive movement snapshots over the UDP channel and queue them for the UI.
+
+    Movement is only sent over UDP after the first datagram arrived, so a
+    blocked channel costs nothing but the bind attempts. Datagrams and
+    snapshots older than the newest ones seen are dropped.
+
+    Args:
+        client_socket (socket.socket): TCP connection, used for acks until UDP works.
+
+    Returns:
+        None
+    """
+    global last_snapshot_seq
+    udp_socket.settimeout(UDP_HELLO_INTERVAL)
+    send_udp_hello()
+    hellos = 1
+    try:
+        while True:
+            try:
+                datagram = udp_socket.recv(protocol.MAX_DATAGRAM_SIZE)
+            except socket.timeout:
+                if udp_state["active"]:
+                    if udp_state["unacked"]:
+                        send_ack(client_socket)  # The last snapshot of a burst
+                elif hellos < UDP_HELLO_ATTEMPTS:
+                    hellos += 1
+                    send_udp_hello()
+                continue
+            try:
+                token, seq, frame = protocol.unpack_datagram(datagram)
+                if token != udp_state["token"] or seq <= udp_state["recv_seq"] or frame[0] != protocol.KIND_RESPONSE:
+                    continue
+                data = protocol.decode_frame(frame)
+            except ValueError:
+                continue
+            udp_state["recv_seq"] = seq
+            if not udp_state["active"]:
+                log.info("UDP channel active")
+                udp_state["active"] = True
+            snapshot_seq = int(data['seq']) if data.get('seq') else 0
+            if data['s_resp_type'] != "1" or snapshot_seq <= last_snapshot_seq or not rebuild_snapshot(data):
+                continue
+            if log.isEnabledFor(logging.DEBUG) and payload_sample():
+                log.debug("Received datagram: %s", Pretty(data))
+            last_snapshot_seq = snapshot_seq
+            ui_queue.put((time.monotonic(), data))
+            udp_state["unacked"] = True
+            if time.monotonic() - last_ack_time >= ACK_INTERVAL:
+                send_ack(client_socket)
+    except OSError as e:
+        log.error("Error receiving UDP data: %s", e)
+
+
+def rebuild_snapshot(data):
+    """
+    Fill in the fields a delta snapshot left out from its baseline snapshot.
+
+    The server diffs against the last snapshot this client acknowledged
+    (base_seq), which is not necessarily the last one received, so a field
+    that went back to its acknowledged value is absent although the newest
+    snapshot holds another one. After this call every STATE_FIELDS value the
+    server knows is present and the message can be applied as is.
+
+    Args:
+        data (dict): Framed snapshot with a 'seq', completed in place.
+
+    Returns:
+        bool: False if the baseline is unknown; the snapshot's state cannot be
+        used then and it must not be acknowledged.
+    """
+    seq = int(data['seq'])
+    base_seq = int(data['base_seq']) if data.get('base_seq') else 0
+    with snapshot_lock:
+        if base_seq:
+            baseline = snapshot_states.get(base_seq)
+            if baseline is None:
+                return False
+            for key, value in zip(STATE_FIELDS, baseline):
+                if data.get(key, "") == "":
+                    data[key] = value
+            # The server never diffs against snapshots older than the one it acknowledged
+            for old in [s for s in snapshot_states if s < base_seq]:
+                del snapshot_states[old]
+        snapshot_states[seq] = tuple(data.get(key, "") for key in STATE_FIELDS)
+        if len(snapshot_states) > SNAPSHOT_HISTORY:
+            del snapshot_states[min(snapshot_states)]
+    return True
 
 
 def send_login_data(client_socket, hero_name):
@@ -510,60 +907,255 @@ def send_login_data(client_socket, hero_name):
     send_data(client_socket, "0", hero_name)
 
 
-def send_position(client_socket, x, y):
-    """Send position update to the server."""
-    send_data(client_socket, "1", character_data['name'], hero_x=str(x), hero_y=str(y))
+def send_position(client_socket, x, y, input_seq):
+    """Send position update to the server, tagged with its input sequence number."""
+    send_data(client_socket, "1", character_data['name'], hero_x=str(x), hero_y=str(y), input_seq=str(input_seq))
+
+
+def send_ack(client_socket):
+    """Acknowledge the newest snapshot received from the server."""
+    global last_ack_time
+    last_ack_time = time.monotonic()
+    udp_state["unacked"] = False
+    send_data(client_socket, "3", character_data['name'])
 
 
 def send_skill(client_socket, skill_index):
-    """Send skill usage to the server and display visual effect."""
-    skill = character_data['skills'][skill_index]
-    damage = random.randint(skill['base_damage'] - 20, skill['base_damage'] + 20)
+    """Send skill usage to the server and display visual effect, unless the skill is cooling down."""
+    stats = character_data['stats']
+    now = time.monotonic()
+    if now < skill_ready_at.get(skill_index, 0.0):
+        return  # The server would drop the cast as well
+    skill_ready_at[skill_index] = now + stats.cooldown[skill_index]
     send_data(client_socket, "2", character_data['name'], hero_skill=str(skill_index),
-              peer_hero=peer_character_data['name'], damage=damage)
+              peer_hero=peer_character_data['name'])
     display_skill_effect(character_data['x'], character_data['y'], peer_character_data['x'], peer_character_data['y'],
                          skill_index)
 
 
-def receive_data(client_socket, canvas, peer_character, peer_health_text, health_text):
+def receive_data(client_socket):
     """
-    Continuously receive data from the server and update the UI accordingly.
+    Continuously receive data from the server and queue it for the UI.
+
+    Runs on a background thread, which must not touch Tk: decoded responses
+    go to ui_queue and drain_ui_queue() applies them on the main loop. Acks
+    and the UDP channel are handled here.
 
     Args:
         client_socket (socket.socket): Client socket.
-        canvas (tk.Canvas): Tkinter canvas object.
-        peer_character (dict): Peer character drawing elements.
-        peer_health_text (int): Peer health text element.
-        health_text (int): Local health text element.
 
     Returns:
         None
     """
-    global recv_buffer
+    global server_framed, last_snapshot_seq
+    decoder = protocol.MessageDecoder()
     try:
         while True:
-            response = client_socket.recv(4096).decode('utf-8')
+            response = client_socket.recv(4096)
             if response:
-                recv_buffer += response
-                while True:
-                    try:
-                        data, index = json.JSONDecoder().raw_decode(recv_buffer)
-                        print(f"Received data: {json.dumps(data, indent=4, ensure_ascii=False)}")
-                        if 's_resp_type' in data:
-                            s_resp_type = data['s_resp_type']
-                            if s_resp_type == "0":
-                                initialize_hero_status(data, canvas, health_text, peer_health_text)
-                            elif s_resp_type == "1":
-                                update_positions(data, canvas, health_text, peer_health_text)
-                            elif s_resp_type == "2":
-                                handle_skill_update(data, canvas, health_text, peer_health_text)
-                        recv_buffer = recv_buffer[index:].lstrip()
-                    except json.JSONDecodeError:
-                        break
+                acked_seq = last_snapshot_seq
+                for data in decoder.feed(response):
+                    server_framed = decoder.framed
+                    if log.isEnabledFor(logging.DEBUG) and payload_sample():
+                        log.debug("Received data: %s", Pretty(data))
+                    if data.get('seq'):
+                        if int(data['seq']) > last_snapshot_seq and rebuild_snapshot(data):
+                            last_snapshot_seq = int(data['seq'])
+                        else:
+                            # Overtaken by a newer snapshot on the UDP channel, or its baseline is gone:
+                            # keep the events, not the positions
+                            for key in POSITION_FIELDS:
+                                data[key] = ""
+                    if data.get('s_resp_type') == "5":
+                        open_udp_channel(client_socket, data)
+                    elif 's_resp_type' in data:
+                        ui_queue.put((time.monotonic(), data))
+                if last_snapshot_seq != acked_seq and time.monotonic() - last_ack_time >= ACK_INTERVAL:
+                    send_ack(client_socket)
             else:
                 break
     except Exception as e:
-        print(f"Error receiving data: {e}")
+        log.error("Error receiving data: %s", e)
+
+
+def render_frame(root, canvas, health_text, peer_health_text):
+    """
+    Draw one frame, then schedule the next one FRAME_RATE later.
+
+    Server messages received since the last frame are applied first;
+    effects expire and animations advance on the same clock. The peer is
+    drawn INTERPOLATION_DELAY in the past, between the two buffered
+    snapshots around that time, so its motion stays smooth whatever the
+    packet rate and jitter. Items whose position did not change are not
+    touched.
+
+    Args:
+        root (tk.Tk): Main window, used to schedule the next frame.
+        canvas (tk.Canvas): Tkinter canvas object.
+        health_text (int): Local health text.
+        peer_health_text (int): Peer health text.
+
+    Returns:
+        None
+    """
+    drain_ui_queue(canvas, health_text, peer_health_text)
+    now = time.monotonic()
+    effect_pool.expire(now)
+    animator.tick(now)
+
+    x, y = character_data['x'], character_data['y']
+    peer_x, peer_y = interpolate_peer(now - INTERPOLATION_DELAY)
+    hh = (SPRITE_SIZE[1] // 2) if 'sprite' in character else 10
+    phh = (SPRITE_SIZE[1] // 2) if 'sprite' in peer_character else 10
+    place_item(canvas, character['sprite'], x, y)
+    place_item(canvas, health_text, x, y - (hh + 10))
+    place_item(canvas, peer_character['sprite'], peer_x, peer_y)
+    place_item(canvas, peer_health_text, peer_x, peer_y - (phh + 10))
+
+    root.after(int(1000 / FRAME_RATE), render_frame, root, canvas, health_text, peer_health_text)
+
+
+def place_item(canvas, item, x, y):
+    """
+    Move a canvas item to (x, y) unless it is already there.
+
+    Images and texts are positioned by their anchor; the fallback ovals are
+    20 px circles centred on the point.
+
+    Args:
+        canvas (tk.Canvas): Tkinter canvas object.
+        item (int): Canvas item id.
+        x (float): X position.
+        y (float): Y position.
+
+    Returns:
+        None
+    """
+    if rendered.get(item) == (x, y):
+        return
+    rendered[item] = (x, y)
+    if canvas.type(item) == "oval":
+        canvas.coords(item, x - 10, y - 10, x + 10, y + 10)
+    else:
+        canvas.coords(item, x, y)
+
+
+def record_peer_sample(received_at, data):
+    """
+    Buffer the peer position of a snapshot for interpolation.
+
+    A peer that stood still sent no snapshots; a sample holding its old
+    position one tick before the new one keeps it from gliding across the
+    whole pause.
+
+    Args:
+        received_at (float): time.monotonic() when the snapshot arrived.
+        data (dict): Snapshot; empty fields mean "unchanged".
+
+    Returns:
+        None
+    """
+    if not data['s_hero2_x'] and not data['s_hero2_y']:
+        return
+    if peer_samples:
+        last_at, x, y = peer_samples[-1]
+        if received_at - last_at > 2 * MOVE_SEND_INTERVAL:
+            peer_samples.append((received_at - MOVE_SEND_INTERVAL, x, y))
+    else:
+        x, y = peer_character_data['x'], peer_character_data['y']
+    peer_samples.append((received_at, int(data['s_hero2_x']) if data['s_hero2_x'] else x,
+                         int(data['s_hero2_y']) if data['s_hero2_y'] else y))
+
+
+def interpolate_peer(render_time):
+    """
+    Peer position at render_time, interpolated between buffered snapshots.
+
+    Args:
+        render_time (float): time.monotonic() value to draw.
+
+    Returns:
+        tuple: (x, y), the newest position if render_time is past every
+        snapshot (no extrapolation).
+    """
+    if not peer_samples:
+        return peer_character_data['x'], peer_character_data['y']
+    newest = peer_samples[-1]
+    if render_time >= newest[0]:
+        return newest[1], newest[2]
+    before = peer_samples[0]
+    if render_time <= before[0]:
+        return before[1], before[2]
+    for after in peer_samples:
+        if after[0] >= render_time:
+            break
+        before = after
+    fraction = (render_time - before[0]) / (after[0] - before[0])
+    return before[1] + (after[1] - before[1]) * fraction, before[2] + (after[2] - before[2]) * fraction
+
+
+def drain_ui_queue(canvas, health_text, peer_health_text):
+    """
+    Apply the server messages received since the last frame (main loop only).
+
+    Every snapshot's peer position is buffered for interpolation. Beyond
+    that, consecutive movement snapshots are merged field by field, newest
+    value first, so a burst of snapshots is applied once; any other message
+    is applied in arrival order, after the movement received before it.
+
+    Args:
+        canvas (tk.Canvas): Tkinter canvas object.
+        health_text (int): Local health text.
+        peer_health_text (int): Peer health text.
+
+    Returns:
+        None
+    """
+    movement = None
+    while True:
+        try:
+            received_at, data = ui_queue.get_nowait()
+        except queue.Empty:
+            break
+        if data['s_resp_type'] in ("1", "2"):
+            record_peer_sample(received_at, data)
+        if data['s_resp_type'] == "1":
+            if movement is None:
+                movement = data
+            else:
+                movement.update((key, value) for key, value in data.items() if value != "")
+            continue
+        if movement is not None:
+            apply_server_message(movement, canvas, health_text, peer_health_text)
+            movement = None
+        apply_server_message(data, canvas, health_text, peer_health_text)
+    if movement is not None:
+        apply_server_message(movement, canvas, health_text, peer_health_text)
+
+
+def apply_server_message(data, canvas, health_text, peer_health_text):
+    """
+    Update the UI for one server response (main loop only).
+
+    Args:
+        data (dict): Data from the server.
+        canvas (tk.Canvas): Tkinter canvas object.
+        health_text (int): Local health text.
+        peer_health_text (int): Peer health text.
+
+    Returns:
+        None
+    """
+    s_resp_type = data['s_resp_type']
+    if s_resp_type == "0":
+        initialize_hero_status(data, canvas, health_text, peer_health_text)
+    elif s_resp_type == "1":
+        update_positions(data, canvas, health_text, peer_health_text)
+        update_health(data, canvas, health_text, peer_health_text)
+    elif s_resp_type == "2":
+        handle_skill_update(data, canvas, health_text, peer_health_text)
+    elif s_resp_type == "4":
+        update_queue_status(data, canvas)
 
 
 def initialize_hero_status(data, canvas, health_text, peer_health_text):
@@ -581,13 +1173,68 @@ def initialize_hero_status(data, canvas, health_text, peer_health_text):
     """
     character_data['name'] = data['s_hero1_name']
     character_data['health'] = int(data['s_hero1_health']) if data['s_hero1_health'] else 0
-    peer_character_data['name'] = data['s_hero2_name']
+    if data['s_hero2_name'] != peer_character_data['name']:
+        peer_character_data['name'] = data['s_hero2_name']
+        draw_peer_sprite(canvas)
+    # Use the server's hero id only if our catalog agrees on it
+    heroes = load_heroes()
+    peer_id = int(data['s_hero2_id']) if data.get('s_hero2_id', "") != "" else None
+    if peer_id is not None and not (0 <= peer_id < len(heroes) and heroes[peer_id].name == data['s_hero2_name']):
+        peer_id = None
+    peer_character_data['id'] = peer_id
     peer_character_data['health'] = int(data['s_hero2_health']) if data['s_hero2_health'] else 0
 
+    canvas.itemconfig(queue_text, text="")
     canvas.itemconfig(health_text, text=f"{character_data['name']} Health: {character_data['health']}")
     canvas.itemconfig(peer_health_text, text=f"{peer_character_data['name']} Health: {peer_character_data['health']}")
 
 
+def update_queue_status(data, canvas):
+    """
+    Show the matchmaking queue position and ETA while waiting for an opponent.
+
+    Args:
+        data (dict): Queue status from the server (type "4").
+        canvas (tk.Canvas): Tkinter canvas object.
+
+    Returns:
+        None
+    """
+    status = f"Waiting for opponent... #{data['queue_pos']}"
+    if data.get('queue_eta') not in ("", None):
+        status += f", ~{data['queue_eta']}s"
+    canvas.itemconfig(queue_text, text=status)
+
+
+def draw_peer_sprite(canvas):
+    """
+    Draw the peer hero, replacing the placeholder once the opponent is known.
+
+    Args:
+        canvas (tk.Canvas): Tkinter canvas object.
+
+    Returns:
+        None
+    """
+    if 'sprite' in peer_character:
+        animator.stop(peer_character['sprite'])
+        canvas.delete(peer_character['sprite'])
+        del peer_character['sprite']
+    if peer_character_data['name']:
+        try:
+            peer_character['sprite'] = create_hero_image(canvas, peer_character_data['name'],
+                                                         peer_character_data['x'], peer_character_data['y'])
+        except Exception as e:
+            log.warning("Cannot load sprite for %s: %s", peer_character_data['name'], e)
+    if 'sprite' not in peer_character:
+        # Fallback / placeholder until the server tells us who the opponent is
+        peer_character['sprite'] = canvas.create_oval(
+            peer_character_data['x'] - 10, peer_character_data['y'] - 10,
+            peer_character_data['x'] + 10, peer_character_data['y'] + 10,
+            fill="blue"
+        )
+
+
 def update_positions2(data, canvas, health_text, peer_health_text):
     """
     Update hero and peer hero positions on the canvas.
@@ -639,30 +1286,66 @@ def update_positions2(data, canvas, health_text, peer_health_text):
 
 def update_positions(data, canvas, health_text, peer_health_text):
     """
-    Update local and peer hero sprite positions based on server data.
+    Update local and peer hero positions based on server data.
+
+    The local hero is reconciled with the server (see reconcile()); the
+    sprites are drawn by render_frame().
     """
-    character_data['x'] = int(data['s_hero1_x']) if data['s_hero1_x'] else character_data['x']
-    character_data['y'] = int(data['s_hero1_y']) if data['s_hero1_y'] else character_data['y']
+    reconcile(data)
     peer_character_data['x'] = int(data['s_hero2_x']) if data['s_hero2_x'] else peer_character_data['x']
     peer_character_data['y'] = int(data['s_hero2_y']) if data['s_hero2_y'] else peer_character_data['y']
 
-    # Sprite centers
-    canvas.coords(character['sprite'], character_data['x'], character_data['y'])
-    canvas.coords(peer_character['sprite'], peer_character_data['x'], peer_character_data['y'])
 
-    # Text above heads (use sprite half height if available)
-    hh = (SPRITE_SIZE[1] // 2) if 'sprite' in character else 10
-    phh = (SPRITE_SIZE[1] // 2) if 'sprite' in peer_character else 10
-    canvas.coords(health_text, character_data['x'], character_data['y'] - (hh + 10))
-    canvas.coords(peer_health_text, peer_character_data['x'], peer_character_data['y'] - (phh + 10))
+def reconcile(data):
+    """
+    Rebase the predicted local position on the server's authoritative one.
+
+    Movement is predicted: input_frame() moves the hero at once and sends
+    each position with an input sequence number. Snapshots tell which input
+    the server applied last (s_input_seq); the hero is put back at the
+    server's position and the inputs sent after that one, plus the movement
+    not sent yet, are replayed on top. With no server correction this lands
+    exactly where the prediction was, whatever the latency. Framed
+    snapshots arrive rebuilt from their baseline (rebuild_snapshot()), so
+    the server position is complete even when it went back to an
+    acknowledged value.
 
+    Args:
+        data (dict): Data from the server; empty fields mean "unchanged".
 
-def handle_skill_update(data, canvas, health_text, peer_health_text):
+    Returns:
+        None
     """
-    Handle skill effect updates and health changes.
+    global server_position
+    if data['s_hero1_x'] or data['s_hero1_y']:
+        base = server_position or (character_data['x'], character_data['y'])
+        server_position = (int(data['s_hero1_x']) if data['s_hero1_x'] else base[0],
+                           int(data['s_hero1_y']) if data['s_hero1_y'] else base[1])
+    elif not data.get('s_input_seq'):
+        return
+    if data.get('s_input_seq'):
+        input_state["acked"] = int(data['s_input_seq'])
+    if input_state["acked"] is None or server_position is None:
+        return  # The server does not echo input numbers, keep the prediction
+    while pending_inputs and pending_inputs[0][0] <= input_state["acked"]:
+        pending_inputs.popleft()
+
+    x, y = server_position
+    for _, dx, dy in pending_inputs:
+        x += dx
+        y += dy
+    sent_x, sent_y = input_state["sent"]
+    character_data['x'] += x - sent_x
+    character_data['y'] += y - sent_y
+    input_state["sent"] = (x, y)
+
+
+def update_health(data, canvas, health_text, peer_health_text):
+    """
+    Apply the health values present in a server snapshot.
 
     Args:
-        data (dict): Data from the server.
+        data (dict): Data from the server; empty fields mean "unchanged".
         canvas (tk.Canvas): Tkinter canvas object.
         health_text (int): Local health text.
         peer_health_text (int): Peer health text.
@@ -670,6 +1353,8 @@ def handle_skill_update(data, canvas, health_text, peer_health_text):
     Returns:
         None
     """
+    if not data['s_hero1_health'] and not data['s_hero2_health']:
+        return
     character_data['health'] = int(data['s_hero1_health']) if data['s_hero1_health'] else character_data['health']
     peer_character_data['health'] = int(data['s_hero2_health']) if data['s_hero2_health'] else peer_character_data[
         'health']
@@ -677,6 +1362,25 @@ def handle_skill_update(data, canvas, health_text, peer_health_text):
     canvas.itemconfig(health_text, text=f"{character_data['name']} Health: {character_data['health']}")
     canvas.itemconfig(peer_health_text, text=f"{peer_character_data['name']} Health: {peer_character_data['health']}")
 
+
+def handle_skill_update(data, canvas, health_text, peer_health_text):
+    """
+    Handle skill effect updates and health changes.
+
+    Args:
+        data (dict): Data from the server.
+        canvas (tk.Canvas): Tkinter canvas object.
+        health_text (int): Local health text.
+        peer_health_text (int): Peer health text.
+
+    Returns:
+        None
+    """
+    update_health(data, canvas, health_text, peer_health_text)
+
+    # Server tick snapshots carry the positions of that tick together with the attack
+    update_positions(data, canvas, health_text, peer_health_text)
+
     skill_index = int(data['s_hero1_skill']) if int(data['s_hero1_skill']) < 99 else int(data['s_hero2_skill'])
     display_skill_effect(character_data['x'], character_data['y'], peer_character_data['x'], peer_character_data['y'],
                          skill_index)
@@ -689,6 +1393,148 @@ def handle_skill_update(data, canvas, health_text, peer_health_text):
         # canvas.itemconfig(peer_character['head'], fill='gray')
 
 
+class Animator:
+    """
+    Advances every animated canvas image from one clock.
+
+    render_frame() calls tick() once per frame. The frame index of each
+    playing item is computed from the elapsed time, and the canvas is only
+    touched when the index changed, so the cost per frame is bounded by the
+    number of animations instead of depending on per-sprite timers. Frame
+    lists come from load_animation_frames() and are shared, so two heroes
+    of the same kind keep one copy of the frames in memory.
+    """
+    __slots__ = ("canvas", "playing")
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.playing = {}  # canvas item -> [frames, fps, start time, loop, shown frame index]
+
+    def play(self, item, frames, fps=ANIMATION_FPS, loop=True):
+        """
+        Start animating a canvas image item.
+
+        Args:
+            item (int): Canvas image item id.
+            frames (list): Tk images, e.g. from load_animation_frames().
+            fps (float): Frames per second.
+            loop (bool): Restart at the end; otherwise stop on the last frame.
+
+        Returns:
+            None
+        """
+        self.playing[item] = [frames, fps, time.monotonic(), loop, 0]
+        self.canvas.itemconfigure(item, image=frames[0])
+
+    def stop(self, item):
+        """Stop animating an item, e.g. before deleting it."""
+        self.playing.pop(item, None)
+
+    def tick(self, now):
+        """Show the current frame of every animation; called once per frame."""
+        finished = []
+        for item, animation in self.playing.items():
+            frames, fps, start, loop, shown = animation
+            index = int((now - start) * fps)
+            if index >= len(frames):
+                if loop:
+                    index %= len(frames)
+                else:
+                    index = len(frames) - 1
+                    finished.append(item)
+            if index != shown:
+                animation[4] = index
+                self.canvas.itemconfigure(item, image=frames[index])
+        for item in finished:
+            del self.playing[item]
+
+
+def create_hero_image(canvas, hero_name, x, y):
+    """
+    Create a hero's image item, animated if the hero has a sprite sheet.
+
+    Args:
+        canvas (tk.Canvas): Tkinter canvas object.
+        hero_name (str): Hero name.
+        x (int): X position.
+        y (int): Y position.
+
+    Returns:
+        int: Canvas item id.
+
+    Raises:
+        Exception: If the hero has neither a sprite sheet nor a sprite.
+    """
+    frames = load_animation_frames(hero_name)
+    if frames:
+        item = canvas.create_image(x, y, image=frames[0], anchor=SPRITE_ANCHOR)
+        animator.play(item, frames)
+        return item
+    img = load_sprite_image(hero_name)
+    SPRITE_REFS.append(img)  # keep reference
+    return canvas.create_image(x, y, image=img, anchor=SPRITE_ANCHOR)
+
+
+class EffectPool:
+    """
+    Reusable canvas items for skill effects.
+
+    An effect is one outline per colour around each hero. All items are
+    created hidden up front; a cast only moves and shows a free set and
+    expire() hides it again, so the canvas item count stays fixed however
+    fast both players cast. With every set of a shape in use, the oldest
+    one is recycled.
+    """
+    __slots__ = ("canvas", "free", "active")
+
+    def __init__(self, canvas, capacity=MAX_EFFECTS):
+        self.canvas = canvas
+        self.free = {shape: [self._create(shape) for _ in range(capacity)] for shape in EFFECT_SHAPES}
+        self.active = deque()  # (expiry time, shape, items), oldest first
+
+    def _create(self, shape):
+        create = getattr(self.canvas, f"create_{shape}")
+        points = (0, 0, 0, 0, 0, 0) if shape == "polygon" else (0, 0, 0, 0)
+        # Two outlines per colour: around the caster and around the peer
+        return [create(*points, outline=color, fill='', width=3, state="hidden")
+                for color in EFFECT_COLORS for _ in range(2)]
+
+    def show(self, shape, points, peer_points, now):
+        """
+        Display an effect until EFFECT_DURATION after `now`.
+
+        Args:
+            shape (str): One of EFFECT_SHAPES.
+            points (tuple): Coordinates of the outline around the caster.
+            peer_points (tuple): Coordinates of the outline around the peer.
+            now (float): time.monotonic() of the cast.
+
+        Returns:
+            None
+        """
+        free = self.free[shape]
+        if not free:
+            oldest = next(i for i, effect in enumerate(self.active) if effect[1] == shape)
+            free.append(self.active[oldest][2])
+            del self.active[oldest]
+        items = free.pop()
+        canvas = self.canvas
+        for i, item in enumerate(items):
+            canvas.coords(item, *(peer_points if i % 2 else points))
+            canvas.itemconfigure(item, state="normal")
+            canvas.tag_raise(item)
+        self.active.append((now + EFFECT_DURATION, shape, items))
+
+    def expire(self, now):
+        """Hide the effects whose time is up; called once per frame."""
+        active = self.active
+        while active and active[0][0] <= now:
+            _, shape, items = active.popleft()
+            for item in items:
+                self.canvas.itemconfigure(item, state="hidden")
+            self.free[shape].append(items)
+
+
 def display_skill_effect(x, y, peer_x, peer_y, skill_index):
     """
     Display skill effects visually on the canvas.
@@ -703,39 +1549,18 @@ def display_skill_effect(x, y, peer_x, peer_y, skill_index):
     Returns:
         None
     """
-    global canvas
-    colors = ["red", "blue", "green", "purple", "orange", "yellow"]
-    effects = []
-
     if skill_index == 0:
         # Triangle
-        for color in colors:
-            points = [x, y - 100, x - 100, y + 100, x + 100, y + 100]
-            effect = canvas.create_polygon(points, outline=color, fill='', width=3)
-            effects.append(effect)
-            points_peer = [peer_x, peer_y - 50, peer_x - 50, peer_y + 50, peer_x + 50, peer_y + 50]
-            effect_peer = canvas.create_polygon(points_peer, outline=color, fill='', width=3)
-            effects.append(effect_peer)
+        effect_pool.show("polygon", (x, y - 100, x - 100, y + 100, x + 100, y + 100),
+                         (peer_x, peer_y - 50, peer_x - 50, peer_y + 50, peer_x + 50, peer_y + 50), time.monotonic())
     elif skill_index == 1:
         # Circle
-        for color in colors:
-            effect = canvas.create_oval(x - 100, y - 100, x + 100, y + 100, outline=color, width=3)
-            effects.append(effect)
-            effect = canvas.create_oval(peer_x - 50, peer_y - 50, peer_x + 50, peer_y + 50, outline=color, width=3)
-            effects.append(effect)
+        effect_pool.show("oval", (x - 100, y - 100, x + 100, y + 100),
+                         (peer_x - 50, peer_y - 50, peer_x + 50, peer_y + 50), time.monotonic())
     elif skill_index == 2:
         # Rectangle
-        for color in colors:
-            effect = canvas.create_rectangle(x - 80, y - 80, x + 80, y + 80, outline=color, width=3)
-            effects.append(effect)
-            effect = canvas.create_rectangle(peer_x - 50, peer_y - 50, peer_x + 50, peer_y + 50, outline=color, width=3)
-            effects.append(effect)
-
-    def remove_effects():
-        for effect in effects:
-            canvas.delete(effect)
-
-    canvas.after(500, remove_effects)
+        effect_pool.show("rectangle", (x - 80, y - 80, x + 80, y + 80),
+                         (peer_x - 50, peer_y - 50, peer_x + 50, peer_y + 50), time.monotonic())
 
 
 def send_health_update(client_socket, health):
@@ -744,7 +1569,7 @@ def send_health_update(client_socket, health):
         health_data = json.dumps({'health_update': {'health': health}}).encode('utf-8')
         client_socket.send(health_data)
     except Exception as e:
-        print(f"Error sending health data: {e}")
+        log.error("Error sending health data: %s", e)
 
 
 def send_name_update(client_socket, name):
@@ -753,7 +1578,7 @@ def send_name_update(client_socket, name):
         name_data = json.dumps({'name': name}).encode('utf-8')
         client_socket.send(name_data)
     except Exception as e:
-        print(f"Error sending name data: {e}")
+        log.error("Error sending name data: %s", e)
 
 
 def move_character2(character, dx, dy, canvas, client_socket, character_data, health_text):
@@ -786,7 +1611,10 @@ def move_character2(character, dx, dy, canvas, client_socket, character_data, he
 
 def move_character(character, dx, dy, canvas, client_socket, character_data, health_text):
     """
-    Move the hero sprite on the canvas and notify the server.
+    Move the hero; render_frame() draws it at its new position.
+
+    The server is not notified here: input_frame sends the accumulated
+    position at most once per MOVE_SEND_INTERVAL.
 
     Args:
         character (dict): Dict containing 'sprite' canvas item id.
@@ -802,9 +1630,55 @@ def move_character(character, dx, dy, canvas, client_socket, character_data, hea
     """
     character_data['x'] += dx
     character_data['y'] += dy
-    canvas.move(character['sprite'], dx, dy)
-    canvas.move(health_text, dx, dy)
-    send_position(client_socket, character_data['x'], character_data['y'])
+
+
+def input_frame(root, character, canvas, client_socket, character_data, health_text):
+    """
+    Sample the held arrow keys once per frame and send the coalesced position.
+
+    Displacement follows the hero's movement_speed and the real frame time, so
+    speed no longer depends on the OS key-repeat rate. Whatever the number of
+    key events, at most one movement message leaves per MOVE_SEND_INTERVAL.
+
+    Args:
+        root (tk.Tk): Main window, used to schedule the next frame.
+        character (dict): Dict containing 'sprite' canvas item id.
+        canvas (tk.Canvas): Canvas object.
+        client_socket (socket.socket): Connected socket.
+        character_data (dict): Local hero data.
+        health_text (int): Canvas text item id for HP.
+
+    Returns:
+        None
+    """
+    now = time.monotonic()
+    dt = min(now - input_state["last_frame"], 0.1) if input_state["last_frame"] else 0.0
+    input_state["last_frame"] = now
+
+    dir_x = sum(ARROW_KEYS[k][0] for k in held_keys)
+    dir_y = sum(ARROW_KEYS[k][1] for k in held_keys)
+    if dir_x or dir_y:
+        step = character_data['movement_speed'] * dt
+        move_x = input_state["carry_x"] + dir_x * step
+        move_y = input_state["carry_y"] + dir_y * step
+        dx, dy = int(move_x), int(move_y)
+        input_state["carry_x"], input_state["carry_y"] = move_x - dx, move_y - dy
+        if dx or dy:
+            move_character(character, dx, dy, canvas, client_socket, character_data, health_text)
+    else:
+        input_state["carry_x"] = input_state["carry_y"] = 0.0
+
+    position = (character_data['x'], character_data['y'])
+    if position != input_state["sent"] and now - input_state["last_send"] >= MOVE_SEND_INTERVAL:
+        sent_x, sent_y = input_state["sent"]
+        input_state["seq"] += 1
+        pending_inputs.append((input_state["seq"], position[0] - sent_x, position[1] - sent_y))
+        input_state["sent"] = position
+        input_state["last_send"] = now
+        send_position(client_socket, *position, input_state["seq"])
+
+    root.after(int(1000 / FRAME_RATE), input_frame, root, character, canvas, client_socket, character_data,
+               health_text)
 
 
 def game_over(winner):
@@ -832,25 +1706,18 @@ def start_client():
     Returns:
         None
     """
-    global character_data, peer_character_data, client_socket, canvas, character, peer_character
+    global character_data, peer_character_data, client_socket, canvas, character, queue_text, effect_pool, animator
+    arena_log.setup_logging()
     heroes = load_heroes()
+    preload_sprites(heroes.names())  # Decoded while the welcome screen is up
     # hero_name = select_hero(heroes)  # Select hero name using command
     # hero_name = select_hero_ui(heroes)
     hero_name = show_welcome_screen(heroes)  # <-- New: GUI home + hero selection
 
     character_data = load_character_data(hero_name)
 
-    # Get the peer hero name
-    peer_name = None
-    for hero in heroes:
-        if hero['name'] != hero_name:
-            peer_name = hero['name']
-            break
-
-    if peer_name is None:
-        raise ValueError("Peer hero name not found")
-
-    initialize_peer_character(peer_name)  # Initialize peer character
+    # The opponent is chosen by the server's matchmaker; its name arrives with the match start
+    initialize_peer_character("")
 
     # client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     # client_socket.connect((SERVER_HOST, SERVER_PORT))  # Ensure port matches server
@@ -922,22 +1789,17 @@ def start_client():
                                           fill="green")
     '''
 
-    # ---- Draw local hero as sprite ----
+    # ---- Draw local hero as sprite (animated if it has a sprite sheet) ----
+    animator = Animator(canvas)
     try:
-        hero_img = load_sprite_image(character_data['name'])
+        hero_item = create_hero_image(canvas, character_data['name'], character_data['x'], character_data['y'])
     except Exception as e:
         from tkinter import messagebox
         messagebox.showwarning("Sprite Missing",
                                f"Cannot load sprite for {character_data['name']}:\n{e}\nFallback to red circle.")
-        hero_img = None
-    if hero_img:
-        SPRITE_REFS.append(hero_img)  # keep reference
-        character = {
-            'sprite': canvas.create_image(
-                character_data['x'], character_data['y'],
-                image=hero_img, anchor=SPRITE_ANCHOR
-            )
-        }
+        hero_item = None
+    if hero_item:
+        character = {'sprite': hero_item}
         sprite_hh = SPRITE_SIZE[1] // 2  # half height for health text offset
     else:
         # Fallback：一个小圆当头像
@@ -956,58 +1818,57 @@ def start_client():
         fill="green"
     )
 
-    # ---- Draw peer hero as sprite ----
-    try:
-        peer_img = load_sprite_image(peer_character_data['name'])
-    except Exception as e:
-        from tkinter import messagebox
-        messagebox.showwarning("Sprite Missing",
-                               f"Cannot load sprite for {peer_character_data['name']}:\n{e}\nFallback to blue circle.")
-        peer_img = None
-    if peer_img:
-        SPRITE_REFS.append(peer_img)
-        peer_character = {
-            'sprite': canvas.create_image(
-                peer_character_data['x'], peer_character_data['y'],
-                image=peer_img, anchor=SPRITE_ANCHOR
-            )
-        }
-        peer_sprite_hh = SPRITE_SIZE[1] // 2
-    else:
-        peer_character = {
-            'sprite': canvas.create_oval(
-                peer_character_data['x'] - 10, peer_character_data['y'] - 10,
-                peer_character_data['x'] + 10, peer_character_data['y'] + 10,
-                fill="blue"
-            )
-        }
-        peer_sprite_hh = 10
+    # ---- Draw peer hero: placeholder until the match starts ----
+    draw_peer_sprite(canvas)
+    peer_sprite_hh = 10
 
     peer_health_text = canvas.create_text(
         peer_character_data['x'], peer_character_data['y'] - (peer_sprite_hh + 10),
-        text=f"{peer_character_data['name']} Health: {peer_character_data['health']}",
+        text="",
         fill="green"
     )
-
-    # Key bindings
-    root.bind("<Left>",
-              lambda event: move_character(character, -10, 0, canvas, client_socket, character_data, health_text))
-    root.bind("<Right>",
-              lambda event: move_character(character, 10, 0, canvas, client_socket, character_data, health_text))
-    root.bind("<Up>",
-              lambda event: move_character(character, 0, -10, canvas, client_socket, character_data, health_text))
-    root.bind("<Down>",
-              lambda event: move_character(character, 0, 10, canvas, client_socket, character_data, health_text))
+    queue_text = canvas.create_text(400, 30, text="Waiting for opponent...", fill="gray", font=("Arial", 14))
+    effect_pool = EffectPool(canvas)
+
+    # Key bindings: arrow keys only mark keys as held, input_frame does the moving
+    for key in ARROW_KEYS:
+        root.bind(f"<KeyPress-{key}>", lambda event, k=key: held_keys.add(k))
+        root.bind(f"<KeyRelease-{key}>", lambda event, k=key: held_keys.discard(k))
+    root.bind("<FocusOut>", lambda event: held_keys.clear())
     root.bind("1", lambda event: send_skill(client_socket, 0))
     root.bind("2", lambda event: send_skill(client_socket, 1))
     root.bind("3", lambda event: send_skill(client_socket, 2))
 
-    threading.Thread(target=receive_data,
-                     args=(client_socket, canvas, peer_character, peer_health_text, health_text),
-                     daemon=True).start()
+    threading.Thread(target=receive_data, args=(client_socket,), daemon=True).start()
+    render_frame(root, canvas, health_text, peer_health_text)
 
+    input_state["sent"] = (character_data['x'], character_data['y'])
+    input_frame(root, character, canvas, client_socket, character_data, health_text)
     root.mainloop()
 
 
+def parse_args(argv=None):
+    """
+    Parse command line options.
+
+    Args:
+        argv (list[str]|None): Arguments, defaults to sys.argv[1:].
+
+    Returns:
+        argparse.Namespace: Parsed options.
+    """
+    parser = argparse.ArgumentParser(description="Arena game client")
+    parser.add_argument("--prescale-sprites", action="store_true",
+                        help=f"store {SPRITE_SIZE[0]}x{SPRITE_SIZE[1]} copies of the sprites in assets/ and exit "
+                             "(needs Pillow)")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    start_client()
+    args = parse_args()
+    if args.prescale_sprites:
+        if not PIL_AVAILABLE:
+            sys.exit("Pillow is required to pre-scale sprites")
+        print(f"{build_scaled_sprites(load_heroes().names())} sprites written")
+    else:
+        start_client()
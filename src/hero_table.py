@@ -0,0 +1,501 @@
+"""
+Compiled hero catalog shared by server_run.py and clientC.py.
+
+property.json is loaded once and every hero is compiled into a HeroStats
+record: a small integer id (its position in the file), base stats and
+per-skill tuples with the precomputed mean damage, the damage bounds and the
+cooldown. The attack path is then a couple of tuple indexes instead of dict
+lookups and arithmetic, and the wire protocol can refer to a hero by its id.
+
+A Catalog keeps the compiled table of one file and reloads it when the file
+changes, so balance edits reach a running server without a restart. Tables
+are never modified once built: whoever holds one (a running match) keeps a
+consistent snapshot of the stats.
+
+For very large rosters, `python hero_table.py property.json` builds
+property.bin: a binary catalog with a name index that is memory-mapped and
+decoded one hero at a time, so startup cost and memory only grow with the
+heroes actually used. It is preferred over the JSON file while it is newer.
+
+    header  = magic, format version, count, id index offset,
+              name index offset, source version (see _HEADER)
+    id index   = count * (record offset, record size), in hero id order
+    name index = count * (name offset, name size, hero id), sorted by name
+    names, then records (compact UTF-8 JSON of each hero entry)
+"""
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+
+DAMAGE_SPREAD = 20  # Damage is rolled uniformly in mean ± DAMAGE_SPREAD
+DEFAULT_MOVE_SPEED = 300  # Pixels per second for heroes without movement_speed
+CHECK_INTERVAL = 1.0  # Seconds between two checks of the catalog file
+
+log = logging.getLogger("arena.catalog")
+_catalogs = {}  # Absolute path -> Catalog, shared by all load() callers
+
+BINARY_MAGIC = b"AHC1"
+BINARY_VERSION = 1
+BINARY_SUFFIX = ".bin"
+_HEADER = struct.Struct("!4sHIII12s")
+_BY_ID = struct.Struct("!II")  # record offset, record size
+_BY_NAME = struct.Struct("!IHI")  # name offset, name size, hero id
+_SKILL_AMOUNTS = ('physical_damage_multiplier', 'magical_damage_multiplier', 'cooldown_time')  # Optional skill fields
+
+
+class HeroStats:
+    """
+    Compiled stats of one hero.
+
+    Skill data is stored column-wise: mean[i], low[i], high[i] and cooldown[i]
+    all describe skill i.
+    """
+    __slots__ = ("id", "name", "base_health", "physical_attack", "magical_attack", "movement_speed",
+                 "skill_names", "mean", "low", "high", "cooldown", "data")
+
+    def __init__(self, hero_id, data):
+        """
+        Args:
+            hero_id (int): Id of the hero in its table.
+            data (dict): Hero entry of property.json.
+        """
+        self.id = hero_id
+        self.name = data['name']
+        self.base_health = data['base_health']
+        self.physical_attack = data['physical_attack']
+        self.magical_attack = data.get('magical_attack', 0)
+        self.movement_speed = data.get('movement_speed', DEFAULT_MOVE_SPEED)
+        skills = data['skills']
+        self.skill_names = tuple(skill['name'] for skill in skills)
+        self.mean = tuple(self._mean_damage(skill) for skill in skills)
+        self.low = tuple(mean - DAMAGE_SPREAD for mean in self.mean)
+        self.high = tuple(mean + DAMAGE_SPREAD for mean in self.mean)
+        self.cooldown = tuple(float(skill.get('cooldown_time', 0)) for skill in skills)
+        self.data = data  # Raw entry, for fields only the UI needs
+
+    def _mean_damage(self, skill):
+        """Average damage of a skill cast by this hero, rounded to an integer."""
+        damage = (skill['base_damage']
+                  + self.physical_attack * skill.get('physical_damage_multiplier', 0)
+                  + self.magical_attack * skill.get('magical_damage_multiplier', 0))
+        return int(round(damage))
+
+    @property
+    def skill_count(self):
+        return len(self.mean)
+
+
+class HeroTable:
+    """
+    All heroes of a catalog, indexed by id and by name.
+
+    Iterating yields HeroStats in id order; table[hero_id] is a list index.
+    """
+
+    def __init__(self, heroes_data, version=""):
+        """
+        Args:
+            heroes_data (list[dict]): The 'heroes' list of property.json.
+            version (str): Content hash of the file the table was built from.
+        """
+        self.heroes = [HeroStats(hero_id, data) for hero_id, data in enumerate(heroes_data)]
+        self.ids = {hero.name: hero.id for hero in self.heroes}
+        self.version = version
+
+    def __len__(self):
+        return len(self.heroes)
+
+    def __iter__(self):
+        return iter(self.heroes)
+
+    def __getitem__(self, hero_id):
+        return self.heroes[hero_id]
+
+    def __contains__(self, name):
+        return isinstance(name, str) and name in self.ids
+
+    def by_name(self, name):
+        """
+        Look up a hero by name.
+
+        Args:
+            name (str): Hero name.
+
+        Returns:
+            HeroStats: Compiled hero.
+
+        Raises:
+            KeyError: If there is no such hero.
+        """
+        return self.heroes[self.ids[name]]
+
+    def names(self):
+        """Hero names in id order."""
+        return [hero.name for hero in self.heroes]
+
+
+class BinaryHeroTable:
+    """
+    Hero table backed by a memory-mapped binary catalog.
+
+    Same interface as HeroTable, but a hero is only decoded and compiled
+    the first time it is looked up; names are found by binary search in
+    the sorted name index.
+    """
+
+    def __init__(self, f):
+        """
+        Args:
+            f (file): Binary catalog opened in 'rb' mode; may be closed afterwards.
+
+        Raises:
+            ValueError: If the file is not a binary catalog of a supported version.
+        """
+        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt_version, count, by_id, by_name, version = _HEADER.unpack_from(self._map, 0)
+        if magic != BINARY_MAGIC or fmt_version != BINARY_VERSION:
+            raise ValueError(f"Not a version {BINARY_VERSION} binary hero catalog")
+        self._count = count
+        self._by_id = by_id
+        self._by_name = by_name
+        self._heroes = {}  # hero id -> HeroStats decoded so far
+        self.version = version.decode('ascii')
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return (self[hero_id] for hero_id in range(self._count))
+
+    def __getitem__(self, hero_id):
+        hero = self._heroes.get(hero_id)
+        if hero is None:
+            if not 0 <= hero_id < self._count:
+                raise IndexError(f"Hero id out of range: {hero_id}")
+            offset, size = _BY_ID.unpack_from(self._map, self._by_id + hero_id * _BY_ID.size)
+            hero = self._heroes[hero_id] = HeroStats(hero_id, json.loads(self._map[offset:offset + size]))
+        return hero
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    def _name_entry(self, index):
+        offset, size, hero_id = _BY_NAME.unpack_from(self._map, self._by_name + index * _BY_NAME.size)
+        return self._map[offset:offset + size], hero_id
+
+    def _find(self, name):
+        """Hero id of a name, or None (also for anything that is not a string)."""
+        if not isinstance(name, str):
+            return None
+        key = name.encode('utf-8')
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry, hero_id = self._name_entry(middle)
+            if entry < key:
+                low = middle + 1
+            elif entry > key:
+                high = middle
+            else:
+                return hero_id
+        return None
+
+    def by_name(self, name):
+        """
+        Look up a hero by name.
+
+        Args:
+            name (str): Hero name.
+
+        Returns:
+            HeroStats: Compiled hero.
+
+        Raises:
+            KeyError: If there is no such hero.
+        """
+        hero_id = self._find(name)
+        if hero_id is None:
+            raise KeyError(name)
+        return self[hero_id]
+
+    def names(self):
+        """Hero names in id order, read from the index without decoding any hero."""
+        names = [""] * self._count
+        for index in range(self._count):
+            name, hero_id = self._name_entry(index)
+            names[hero_id] = name.decode('utf-8')
+        return names
+
+
+def validate(data):
+    """
+    Check that parsed property.json data can be compiled.
+
+    Every field HeroStats reads is checked, so a broken edit is reported as
+    a ValueError instead of failing later inside the compiler.
+
+    Args:
+        data (dict): Parsed property.json.
+
+    Returns:
+        list[dict]: The 'heroes' list.
+
+    Raises:
+        ValueError: If a hero or skill is missing a field or has a bad value.
+    """
+    heroes = data.get('heroes') if isinstance(data, dict) else None
+    if not isinstance(heroes, list) or not heroes:
+        raise ValueError("property.json has no 'heroes' list")
+    names = set()
+    for hero in heroes:
+        if not isinstance(hero, dict):
+            raise ValueError(f"Hero entry is not an object: {hero!r:.80}")
+        name = hero.get('name')
+        if not isinstance(name, str) or not name:
+            raise ValueError(f"Hero without a name: {hero!r:.80}")
+        if name in names:
+            raise ValueError(f"Duplicate hero: {name}")
+        names.add(name)
+        for key, required in (('base_health', True), ('physical_attack', True),
+                              ('magical_attack', False), ('movement_speed', False)):
+            if (required or key in hero) and not _is_amount(hero.get(key)):
+                raise ValueError(f"Hero {name}: bad {key} {hero.get(key)!r}")
+        skills = hero.get('skills')
+        if not isinstance(skills, list) or not skills:
+            raise ValueError(f"Hero {name} has no skills")
+        for skill in skills:
+            if (not isinstance(skill, dict) or not isinstance(skill.get('name'), str)
+                    or not _is_number(skill.get('base_damage'))
+                    or not all(_is_amount(skill[key]) for key in _SKILL_AMOUNTS if key in skill)):
+                raise ValueError(f"Hero {name}: bad skill {skill!r:.80}")
+    return heroes
+
+
+def _is_number(value):
+    """True for a finite int or float (bool is not a number here)."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def _is_amount(value):
+    """True for a number that is not negative."""
+    return _is_number(value) and value >= 0
+
+
+class Catalog:
+    """
+    Compiled hero table of one file, rebuilt when the file changes.
+
+    get() stats the file at most once per check_interval. A different
+    (mtime, size) makes it hash the content; only a different hash makes it
+    parse, validate and compile a new table. A broken edit is logged and
+    the previous table stays in use. Binary catalogs carry the hash of
+    their source in the header and are mapped instead of parsed.
+
+    Every check also picks the file again with catalog_path(), so editing
+    property.json takes effect even when the server started on a (now
+    older) binary catalog, and a rebuilt binary catalog is picked up.
+    """
+
+    def __init__(self, file_path, check_interval=CHECK_INTERVAL):
+        """
+        Args:
+            file_path (str): Path to property.json (its binary catalog is used while
+                it is up to date) or to a binary catalog.
+            check_interval (float): Seconds between two checks of the file.
+
+        Raises:
+            OSError: If the file cannot be read.
+            ValueError: If the file is not a valid catalog.
+        """
+        self.source = file_path
+        self.path = None  # File the table is read from, chosen by catalog_path()
+        self.check_interval = check_interval
+        self.table = None
+        self._stamp = None  # (mtime_ns, size) of the file the table was built from
+        self._next_check = 0.0
+        self.reload()
+
+    def get(self):
+        """
+        Return the current table, reloading it first if the file changed.
+
+        Returns:
+            HeroTable|BinaryHeroTable: Current compiled heroes.
+        """
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            try:
+                self.reload()
+            except (OSError, ValueError) as e:
+                log.warning("Keeping hero catalog %s, reload of %s failed: %s", self.table.version, self.path, e)
+        return self.table
+
+    def reload(self):
+        """
+        Rebuild the table if the file content changed.
+
+        Returns:
+            bool: True if a new table was built.
+
+        Raises:
+            OSError: If the file cannot be read.
+            ValueError: If the file is not a valid catalog.
+        """
+        path = catalog_path(self.source)
+        if path != self.path:
+            if self.path is not None:
+                log.info("Hero catalog now read from %s", path)
+            binary = binary_path(self.source)
+            if path == self.source != binary and os.path.exists(binary):
+                log.warning("%s is older than %s, using the JSON catalog", binary, self.source)
+            self.path = path
+            self._stamp = None
+        stat = os.stat(self.path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return False
+        table = None
+        with open(self.path, 'rb') as f:
+            if f.read(len(BINARY_MAGIC)) == BINARY_MAGIC:
+                table = BinaryHeroTable(f)
+                version = table.version
+            else:
+                f.seek(0)
+                raw = f.read()
+                version = hashlib.sha1(raw).hexdigest()[:12]
+        self._stamp = stamp  # A broken edit is reported once, not on every check
+        if self.table is not None and version == self.table.version:
+            return False  # Touched but not changed
+        if table is None:
+            table = HeroTable(validate(json.loads(raw.decode('utf-8'))), version)
+        if self.table is not None:
+            log.info("Hero catalog reloaded: %s -> %s (%d heroes)", self.table.version, version, len(table))
+        self.table = table
+        return True
+
+
+def binary_path(file_path):
+    """Path of the binary catalog built from a JSON catalog."""
+    return os.path.splitext(file_path)[0] + BINARY_SUFFIX
+
+
+def build_binary(file_path, output_path=None):
+    """
+    Build the binary catalog of a JSON catalog.
+
+    The output is written to a temporary file and then renamed over the old
+    one, so processes that still map the old catalog are not disturbed
+    (Windows refuses the rename while a server has the old file mapped).
+
+    Args:
+        file_path (str): Path to property.json.
+        output_path (str|None): Binary catalog path, defaults to binary_path(file_path).
+
+    Returns:
+        int: Number of heroes written.
+
+    Raises:
+        ValueError: If the JSON catalog is invalid.
+    """
+    output_path = output_path or binary_path(file_path)
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    heroes = validate(json.loads(raw.decode('utf-8')))
+    version = hashlib.sha1(raw).hexdigest()[:12].encode('ascii')
+    names = [hero['name'].encode('utf-8') for hero in heroes]
+    records = [json.dumps(hero, ensure_ascii=False, separators=(",", ":")).encode('utf-8') for hero in heroes]
+    count = len(heroes)
+
+    by_id_offset = _HEADER.size
+    by_name_offset = by_id_offset + count * _BY_ID.size
+    offset = by_name_offset + count * _BY_NAME.size
+    name_offsets = []
+    for name in names:
+        name_offsets.append(offset)
+        offset += len(name)
+    by_id = []
+    for record in records:
+        by_id.append(_BY_ID.pack(offset, len(record)))
+        offset += len(record)
+    by_name = [_BY_NAME.pack(name_offsets[i], len(names[i]), i) for i in sorted(range(count), key=names.__getitem__)]
+
+    temp_path = output_path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, count, by_id_offset, by_name_offset, version))
+        f.write(b"".join(by_id))
+        f.write(b"".join(by_name))
+        f.write(b"".join(names))
+        f.write(b"".join(records))
+    os.replace(temp_path, output_path)
+    return count
+
+
+def catalog_path(file_path):
+    """
+    Choose between a JSON catalog and the binary catalog built from it.
+
+    Args:
+        file_path (str): Path to property.json.
+
+    Returns:
+        str: The binary catalog if it exists and is not older than the JSON file, else file_path.
+    """
+    binary = binary_path(file_path)
+    try:
+        binary_mtime = os.stat(binary).st_mtime_ns
+    except OSError:
+        return file_path
+    try:
+        source_mtime = os.stat(file_path).st_mtime_ns
+    except OSError:
+        return binary
+    return binary if binary_mtime >= source_mtime else file_path
+
+
+def catalog(file_path):
+    """
+    Shared Catalog of a file, created on first use.
+
+    Args:
+        file_path (str): Path to property.json; its binary catalog is used if up to date.
+
+    Returns:
+        Catalog: Catalog of the file.
+    """
+    key = os.path.abspath(file_path)
+    if key not in _catalogs:
+        _catalogs[key] = Catalog(file_path)
+    return _catalogs[key]
+
+
+def load(file_path):
+    """
+    Current compiled heroes of a catalog file.
+
+    The file is parsed once; later calls return the cached table until the
+    file changes.
+
+    Args:
+        file_path (str): Path to property.json.
+
+    Returns:
+        HeroTable|BinaryHeroTable: Compiled heroes.
+    """
+    return catalog(file_path).get()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the binary hero catalog from property.json")
+    parser.add_argument("source", nargs="?", default="property.json", help="JSON catalog (default: %(default)s)")
+    parser.add_argument("-o", "--output", help="binary catalog (default: source with .bin suffix)")
+    args = parser.parse_args()
+    output = args.output or binary_path(args.source)
+    print(f"Wrote {build_binary(args.source, output)} heroes to {output}")
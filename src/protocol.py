@@ -0,0 +1,366 @@
+"""
+Wire protocol shared by server_run.py and clientC.py.
+
+Legacy clients exchange bare JSON objects. A client that puts
+"wire": WIRE_VERSION into its login message tells the server it understands
+framed messages; from then on the server answers it with frames, and once the
+client sees the first frame it sends frames too.
+
+    frame = length (uint16, big endian) + kind (uint8) + body
+
+Requests (opr_type "1"/"2") and responses (resp()) are struct-packed: one
+byte for the message type, a bitmask of the fields that are present and then
+only those fields. Empty-string fields are simply left out, so a movement
+update is a few dozen bytes instead of ~300 bytes of JSON.
+After the login, framed clients refer to heroes by their hero_table id
+instead of by name.
+
+Frame lengths are capped below 0x7B00, so the first byte of a frame can
+never be "{" and both message styles can be told apart on the same stream.
+
+Framed clients may also get a UDP channel for movement (see
+server_run.open_udp_session). Each datagram holds exactly one frame:
+
+    datagram = session token (uint64) + sequence number (uint32) + frame
+"""
+import json
+import struct
+
+WIRE_VERSION = 2  # 2: 32-bit field masks and movement input sequence numbers
+
+KIND_JSON = 0  # Body is a UTF-8 JSON object (rare messages)
+KIND_REQUEST = 1  # Body is a packed client request (send_data)
+KIND_RESPONSE = 2  # Body is a packed server response (resp)
+
+MAX_FRAME_SIZE = 0x3FFF
+MAX_BUFFER_SIZE = 64 * 1024  # Pending bytes allowed per connection
+MAX_DATAGRAM_SIZE = 1200  # Receive size for UDP datagrams, well below common MTUs
+JSON_START = ord("{")
+NUMBER_MIN, NUMBER_MAX = -2 ** 31, 2 ** 31 - 1  # Range of "n" fields, packed as signed 32-bit integers
+
+# Field tables: (key, kind) where kind is "s" string, "n" number, "b" bool
+REQUEST_FIELDS = (
+    ("hero_name", "s"),
+    ("hero_x", "n"),
+    ("hero_y", "n"),
+    ("hero_skill", "n"),
+    ("peer_hero", "s"),
+    ("ack", "n"),  # Last snapshot sequence number received
+    ("hero_id", "n"),  # Hero table id, replaces hero_name after the login
+    ("peer_id", "n"),  # Hero table id, replaces peer_hero after the login
+    ("input_seq", "n"),  # Sequence number of a movement input, for client prediction
+)
+RESPONSE_FIELDS = (
+    ("s_hero1_name", "s"),
+    ("s_hero1_health", "n"),
+    ("s_hero2_name", "s"),
+    ("s_hero2_health", "n"),
+    ("s_hero1_x", "n"),
+    ("s_hero1_y", "n"),
+    ("s_hero2_x", "n"),
+    ("s_hero2_y", "n"),
+    ("s_hero1_skill", "n"),
+    ("s_hero2_skill", "n"),
+    ("died", "b"),
+    ("seq", "n"),  # Snapshot sequence number
+    ("queue_pos", "n"),  # Matchmaking queue position (type "4")
+    ("queue_eta", "n"),  # Estimated seconds until a match (type "4")
+    ("s_hero1_id", "n"),  # Hero table ids, sent with the names in the login response
+    ("s_hero2_id", "n"),
+    ("s_input_seq", "n"),  # Last movement input of the receiving player applied by the server
+    ("base_seq", "n"),  # Snapshot the delta was computed against, empty for full snapshots
+)
+
+_LENGTH = struct.Struct("!H")
+_RECORD = struct.Struct("!BI")  # message type, field mask (up to 32 fields)
+_NUMBER = struct.Struct("!i")
+_BOOL = struct.Struct("!?")
+_STR_LEN = struct.Struct("!B")
+_DATAGRAM = struct.Struct("!QI")  # session token, datagram sequence number
+_WHITESPACE = frozenset(b" \t\r\n")
+
+
+def pack_frame(kind, body):
+    """
+    Prefix a frame body with its length.
+
+    Args:
+        kind (int): Frame kind (KIND_*).
+        body (bytes): Frame body without the kind byte.
+
+    Returns:
+        bytes: Complete frame.
+
+    Raises:
+        ValueError: If the frame is larger than MAX_FRAME_SIZE.
+    """
+    size = len(body) + 1
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame too large: {size} bytes")
+    return _LENGTH.pack(size) + bytes((kind,)) + body
+
+
+def _pack_record(kind, type_key, fields, data):
+    """Pack a request/response dict into a frame, skipping empty fields."""
+    mask = 0
+    parts = []
+    for bit, (key, field_kind) in enumerate(fields):
+        value = data.get(key, "")
+        if value == "" or value is None:
+            continue
+        mask |= 1 << bit
+        if field_kind == "n":
+            parts.append(_NUMBER.pack(int(value)))
+        elif field_kind == "b":
+            parts.append(_BOOL.pack(bool(value)))
+        else:
+            raw = str(value).encode("utf-8")
+            parts.append(_STR_LEN.pack(len(raw)) + raw)
+    return pack_frame(kind, _RECORD.pack(int(data[type_key]), mask) + b"".join(parts))
+
+
+def _unpack_record(body, offset, type_key, fields):
+    """Unpack a request/response body into a dict shaped like the JSON message."""
+    msg_type, mask = _RECORD.unpack_from(body, offset)
+    offset += _RECORD.size
+    data = {type_key: str(msg_type)}
+    for bit, (key, field_kind) in enumerate(fields):
+        if not mask & (1 << bit):
+            data[key] = ""
+        elif field_kind == "n":
+            # Numbers are handed out as strings, like the JSON protocol does
+            data[key] = str(_NUMBER.unpack_from(body, offset)[0])
+            offset += 4
+        elif field_kind == "b":
+            data[key] = _BOOL.unpack_from(body, offset)[0]
+            offset += 1
+        else:
+            size = body[offset]
+            if offset + 1 + size > len(body):
+                raise ValueError(f"Truncated string field: {key}")
+            data[key] = bytes(body[offset + 1:offset + 1 + size]).decode("utf-8")
+            offset += 1 + size
+    return data
+
+
+def encode_request(data):
+    """
+    Encode a client request (see clientC.send_data) as a frame.
+
+    Args:
+        data (dict): Request with 'opr_type' and the REQUEST_FIELDS keys.
+
+    Returns:
+        bytes: Frame bytes.
+    """
+    return _pack_record(KIND_REQUEST, "opr_type", REQUEST_FIELDS, data)
+
+
+def encode_response(data):
+    """
+    Encode a server response (see server_run.resp) as a frame.
+
+    Args:
+        data (dict): Response with 's_resp_type' and the RESPONSE_FIELDS keys.
+
+    Returns:
+        bytes: Frame bytes.
+    """
+    return _pack_record(KIND_RESPONSE, "s_resp_type", RESPONSE_FIELDS, data)
+
+
+def encode_json(data):
+    """
+    Encode an arbitrary dict as a JSON frame.
+
+    Args:
+        data (dict): Message data.
+
+    Returns:
+        bytes: Frame bytes.
+    """
+    return pack_frame(KIND_JSON, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+def decode_frame(frame):
+    """
+    Decode one frame body (kind byte + body, without the length prefix).
+
+    Args:
+        frame (bytes|memoryview): Frame body.
+
+    Returns:
+        dict: Decoded message, shaped like the equivalent JSON message.
+
+    Raises:
+        ValueError: If the frame kind is unknown, the body is truncated or
+            does not match its field mask, or a JSON body is not an object.
+    """
+    kind = frame[0]
+    try:
+        if kind == KIND_REQUEST:
+            return _unpack_record(frame, 1, "opr_type", REQUEST_FIELDS)
+        if kind == KIND_RESPONSE:
+            return _unpack_record(frame, 1, "s_resp_type", RESPONSE_FIELDS)
+    except (struct.error, IndexError) as e:
+        # Fields the mask announces run past the end of the body
+        raise ValueError(f"Malformed frame: {e}") from None
+    if kind == KIND_JSON:
+        try:
+            message = json.loads(bytes(frame[1:]).decode("utf-8"))
+        except RecursionError:
+            raise ValueError("JSON frame nested too deeply") from None
+        if not isinstance(message, dict):
+            raise ValueError(f"JSON frame is not an object: {type(message).__name__}")
+        return message
+    raise ValueError(f"Unknown frame kind: {kind}")
+
+
+def pack_datagram(token, seq, frame):
+    """
+    Wrap a frame for the UDP channel.
+
+    Args:
+        token (int): Session token from the login.
+        seq (int): Datagram sequence number of the sender.
+        frame (bytes): Complete frame (see pack_frame).
+
+    Returns:
+        bytes: Datagram payload.
+    """
+    return _DATAGRAM.pack(token, seq) + frame
+
+
+def unpack_datagram(data):
+    """
+    Split a UDP datagram into its header and frame.
+
+    Args:
+        data (bytes): Datagram payload.
+
+    Returns:
+        tuple: (token, seq, frame body) where the frame body is what
+        decode_frame() expects.
+
+    Raises:
+        ValueError: If the datagram is truncated or its frame length is wrong.
+    """
+    start = _DATAGRAM.size + _LENGTH.size
+    if len(data) <= start:
+        raise ValueError(f"Datagram too short: {len(data)} bytes")
+    token, seq = _DATAGRAM.unpack_from(data)
+    if _LENGTH.unpack_from(data, _DATAGRAM.size)[0] != len(data) - start:
+        raise ValueError("Datagram length does not match its frame")
+    return token, seq, memoryview(data)[start:]
+
+
+class MessageDecoder:
+    """
+    Incremental decoder for a byte stream of JSON and framed messages.
+
+    Received bytes are appended to one bytearray; every call to feed() drains
+    all complete messages, so several messages arriving in one TCP segment
+    are handled at once instead of waiting for the next read. Consumed bytes
+    are dropped once per feed() and the pending data is bounded by max_buffer.
+
+    An optional admit(opr_type) callback decides whether a request is kept.
+    Request frames carry their type in a fixed byte, so rejected frames are
+    skipped without being unpacked; JSON messages can only be checked once
+    they are parsed.
+    """
+
+    def __init__(self, max_buffer=MAX_BUFFER_SIZE, admit=None):
+        self._buffer = bytearray()
+        self._json = json.JSONDecoder()
+        self.max_buffer = max_buffer
+        self.admit = admit
+        self.framed = False  # True once the peer has sent a framed message
+        self.dropped = 0  # Messages rejected by admit
+
+    def feed(self, data):
+        """
+        Add received bytes and decode every complete message.
+
+        Args:
+            data (bytes): Bytes just read from the socket.
+
+        Returns:
+            list[dict]: Decoded messages, in stream order.
+
+        Raises:
+            ValueError: If the stream is malformed or the buffer limit is exceeded.
+        """
+        buffer = self._buffer
+        buffer += data
+        messages = []
+        admit = self.admit
+        pos = 0
+        end = len(buffer)
+
+        with memoryview(buffer) as view:
+            while pos < end:
+                first = buffer[pos]
+                if first in _WHITESPACE:
+                    pos += 1
+                elif first == JSON_START:  # Legacy JSON messages
+                    if buffer.find(b"}", pos) < 0:
+                        break
+                    # Decode the text once and walk every JSON object in it
+                    text = bytes(view[pos:]).decode("utf-8", "surrogateescape")
+                    index = 0
+                    try:
+                        while index < len(text) and text[index] == "{":
+                            message, index = self._json.raw_decode(text, index)
+                            if admit is None or admit(message.get("opr_type")):
+                                messages.append(message)
+                            else:
+                                self.dropped += 1
+                            while index < len(text) and text[index] in " \t\r\n":
+                                index += 1
+                    except json.JSONDecodeError:
+                        pass  # Incomplete object, wait for more bytes
+                    except RecursionError:
+                        raise ValueError("JSON message nested too deeply") from None
+                    if not index:
+                        break
+                    pos += len(text[:index].encode("utf-8", "surrogateescape"))
+                elif first < 0x40:  # Framed message
+                    if end - pos < _LENGTH.size:
+                        break
+                    size = _LENGTH.unpack_from(buffer, pos)[0]
+                    if not 0 < size <= MAX_FRAME_SIZE:
+                        raise ValueError(f"Invalid frame size: {size}")
+                    stop = pos + _LENGTH.size + size
+                    if stop > end:
+                        break
+                    self.framed = True
+                    kind = buffer[pos + _LENGTH.size]
+                    if admit is not None and kind == KIND_REQUEST and size > _RECORD.size:
+                        # Check the request type byte before unpacking anything
+                        if not admit(str(buffer[pos + _LENGTH.size + 1])):
+                            self.dropped += 1
+                            pos = stop
+                            continue
+                    message = decode_frame(view[pos + _LENGTH.size:stop])
+                    if admit is None or kind == KIND_REQUEST or admit(message.get("opr_type")):
+                        messages.append(message)
+                    else:
+                        self.dropped += 1
+                    pos = stop
+                else:
+                    raise ValueError(f"Unexpected byte in stream: {first:#04x}")
+
+        if pos:
+            del buffer[:pos]
+        if len(buffer) > self.max_buffer:
+            raise ValueError(f"Receive buffer overflow: {len(buffer)} bytes pending")
+        return messages
+
+    def pending(self):
+        """
+        Bytes received but not decoded yet, i.e. the start of an incomplete message.
+
+        Returns:
+            bytes: Buffered bytes, for a decoder that takes the stream over.
+        """
+        return bytes(self._buffer)
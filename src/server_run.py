@@ -1,9 +1,21 @@
+import argparse
+import asyncio
 import json
+import logging
+import multiprocessing
+import multiprocessing.connection
+import multiprocessing.reduction
 import random
+import secrets
+import signal
 import socket
-import threading
-import select
 import time
+from collections import deque
+import arena_log
+import damage
+import hero_table
+import protocol
+from arena_log import Pretty
 # 放到文件顶部附近（clientC.py / server_run.py 都建议加）
 import os, sys
 from pathlib import Path
@@ -39,64 +51,68 @@ def resource_path(rel_path: str) -> str:
 # =========================
 SERVER_HOST = "127.0.0.1"
 SERVER_PORT = 1212  # Default port for the server, can be changed if needed
+SERVER_BACKLOG = 1024  # Pending connections queued by the OS during connection bursts
+TICK_RATE = 30  # Simulation steps per second, e.g. 20 / 30 / 60
+KEYFRAME_INTERVAL = 60  # Ticks between full snapshots sent to a client
+SNAPSHOT_HISTORY = 64  # Unacknowledged snapshots remembered per client
+LOGIN_TIMEOUT = 5.0  # Seconds a new connection has to send its login
+OUTBOX_HIGH_WATER = 64 * 1024  # Bytes buffered for a client before its movement snapshots are skipped
+OUTBOX_LIMIT = 1024 * 1024  # Bytes buffered for a client before it is disconnected
+MATCHMAKING = "any"  # Pair "any" players, only the same "hero", or by "rating" bracket
+MAX_MATCHES = 0  # Concurrent matches per process, 0 for no limit
+RATING_BRACKET = 200  # Width of a rating bracket
+DEFAULT_RATING = 1000  # Rating of players whose login carries none
+QUEUE_REPORT_INTERVAL = 1.0  # Seconds between queue position updates
+COOLDOWN_SLACK = 0.1  # Seconds of network jitter forgiven when checking skill cooldowns
+CONNECTION_RATE = (120, 60)  # Messages per second and burst allowed per connection
+MESSAGE_RATES = {  # opr_type -> (messages per second, burst)
+    "0": (1, 2),  # Login
+    "1": (60, 30),  # Movement
+    "2": (10, 5),  # Attack, cooldowns reject most of these anyway
+    "3": (30, 10),  # Snapshot ack
+}
+UDP_PORT = SERVER_PORT  # UDP port of the movement channel (one per worker, counting up), 0 disables it
+UDP_REQUEST_TYPES = ("1", "3")  # Requests accepted over UDP: movement and snapshot acks
+UDP_FALLBACK_TIMEOUT = 3.0  # Seconds without acks for UDP snapshots before falling back to TCP
+WORKERS = 1  # Worker processes sharing the listen port, 1 runs everything in this process
+STATS_INTERVAL = 10.0  # Seconds between worker stats reports to the supervisor
+WORKER_MIN_UPTIME = 2.0  # Workers that die sooner than this are not restarted
+HANDOFF_DELAY = 2.0  # Seconds a player waits alone in its bracket before it may move to another worker
+HANDOFF_CHECK_INTERVAL = 1.0  # Seconds between reports of lone waiting players to the supervisor
+HANDOFF_SUPPORTED = os.name == "posix"  # Connections are passed between workers as file descriptors
 
+log = logging.getLogger("arena.server")
+payload_sample = arena_log.Sampler()  # Sampling of per-message DEBUG payload logs
 
+matchmaker = None  # Matchmaker of this process, created by serve()
+connection_count = 0  # Open client connections of this process
+match_counter = 0
+active_matches = set()  # Matches driven by the tick loop
+flush_queue = []  # Players with output waiting for the next flush_outboxes()
+udp_transport = None  # Datagram transport of the UDP channel, None if disabled
+control_channel = None  # Connection to the supervisor in a worker process
+adopting = set()  # Tasks serving connections handed over by other workers
+udp_sessions = {}  # UDP session token -> PlayerState
 
 
-class Hero:
-    def __init__(self, name, base_health, physical_attack, skills):
-        self.name = name
-        self.base_health = base_health
-        self.physical_attack = physical_attack
-        self.skills = skills
 
-    @staticmethod
-    def load_from_file(file_path='property.json'):
-        """
-        Load hero data from a JSON file and create Hero objects.
-
-        Args:
-            file_path (str): Path to the JSON file.
-
-        Returns:
-            dict: A dictionary containing all hero objects.
-        """
-        # with open(file_path, 'r', encoding='utf-8') as f:
-        #with open(resource_path(file_path), 'r', encoding='utf-8') as f:
-
-        # 原来：with open('property.json', 'r', encoding='utf-8') as f:
-        # 改成：
-        prop_file = resource_path('property.json')
-
-        # 调试/自检：如果文件不存在或大小为0，提前给出更友好的错误
-        if not Path(prop_file).exists() or Path(prop_file).stat().st_size == 0:
-            raise FileNotFoundError(f"property.json 未找到或为空：{prop_file}")
-
-        with open(prop_file, 'r', encoding='utf-8') as f:
-            #data = json.load(f)
-            heroes_data = json.load(f)
-        heroes = {}
-        for hero in heroes_data['heroes']:
-            heroes[hero['name']] = Hero(hero['name'], hero['base_health'], hero['physical_attack'], hero['skills'])
-        return heroes
-
-
-def calculate_damage(skill, hero):
+def load_catalog(file_path='property.json'):
     """
-    Calculate the damage dealt by a skill.
+    Load hero data from a JSON file into a hot-reloadable hero catalog.
 
     Args:
-        skill (dict): Skill data.
-        hero (Hero): The hero using the skill.
+        file_path (str): Path to the JSON file.
 
     Returns:
-        int: Randomized damage value.
+        hero_table.Catalog: Catalog whose get() returns the current hero table.
     """
-    base_damage = skill['base_damage']
-    multiplier = skill['physical_damage_multiplier']
-    physical_attack = hero.physical_attack
-    damage = base_damage + physical_attack * multiplier
-    return random.randint(damage - 20, damage + 20)
+    prop_file = resource_path(file_path)
+
+    # 调试/自检：如果文件不存在或大小为0，提前给出更友好的错误
+    if not Path(prop_file).exists() or Path(prop_file).stat().st_size == 0:
+        raise FileNotFoundError(f"property.json 未找到或为空：{prop_file}")
+
+    return hero_table.catalog(prop_file)
 
 
 def resp(type, name, health, p_name, p_health, x, y, p_x, p_y, skill, p_skill, healthy):
@@ -137,221 +153,1617 @@ def resp(type, name, health, p_name, p_health, x, y, p_x, p_y, skill, p_skill, h
     return response
 
 
-def handle_client(client_socket, peer_socket, client_data, peer_client_data, heroes):
+class PlayerState:
+    """
+    State of one player inside a match.
+
+    Uses __slots__ so thousands of live matches stay small in memory and
+    attribute access in the message hot path avoids a per-instance dict.
+    """
+    __slots__ = ("reader", "writer", "framed", "login", "ticket", "bracket", "queued_at", "reported", "handoff",
+                 "match", "hero_id", "hero_name", "health", "ready_at", "x", "y", "input_seq", "move", "attacks",
+                 "seq", "acked", "history", "keyframe_tick", "udp", "outbox")
+
+    def __init__(self, writer=None, reader=None):
+        self.reader = reader  # asyncio.StreamReader of the connection
+        self.writer = writer  # asyncio.StreamWriter of the connection
+        self.framed = False  # Client negotiated framed messages at login
+        self.login = None  # Login message
+        self.ticket = 0  # Matchmaking ticket while queued, 0 otherwise
+        self.bracket = None  # Matchmaking bracket key
+        self.queued_at = 0.0  # time.monotonic() when the player was queued
+        self.reported = None  # Last (position, eta) sent to the client
+        self.handoff = None  # Worker the connection is being handed to
+        self.match = None  # Match the player is in, None while queued
+        self.hero_id = None  # Id of the hero in the hero table of its match
+        self.hero_name = None
+        self.health = 0
+        self.ready_at = ()  # Per skill: time.monotonic() from which it can be cast again
+        self.x = ""  # Authoritative position, "" until the first move
+        self.y = ""
+        self.input_seq = ""  # Client's sequence number of the movement input behind x/y
+        self.move = None  # Latest (x, y, input_seq) received since the last tick
+        self.attacks = []  # Skill indices received since the last tick
+        self.seq = 0  # Sequence number of the last snapshot sent
+        self.acked = 0  # Last snapshot sequence acknowledged by the client
+        self.history = {}  # seq -> snapshot state, kept until acknowledged
+        self.keyframe_tick = 0  # Match tick of the last full snapshot
+        self.udp = None  # UdpSession if the client asked for the UDP channel
+        self.outbox = []  # Encoded messages waiting for the next flush
+
+
+class TokenBucket:
+    """
+    Token bucket admission control: `rate` tokens per second, at most `capacity`.
+    """
+    __slots__ = ("rate", "capacity", "tokens", "stamp")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+
+    def take(self, now):
+        """Take one token if available; returns False if the bucket is empty."""
+        tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if tokens < 1:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1
+        return True
+
+
+class RateLimiter:
+    """
+    Admission control of one connection, used as MessageDecoder.admit.
+
+    A message must get a token from the connection's bucket and from the
+    bucket of its message type, otherwise it is dropped before dispatch
+    (for framed requests, before they are even unpacked).
+    """
+    __slots__ = ("connection", "types")
+
+    def __init__(self):
+        self.connection = TokenBucket(*CONNECTION_RATE)
+        self.types = {opr_type: TokenBucket(*limit) for opr_type, limit in MESSAGE_RATES.items()}
+
+    def __call__(self, opr_type):
+        now = time.monotonic()
+        bucket = self.types.get(opr_type)
+        return self.connection.take(now) and (bucket is None or bucket.take(now))
+
+
+class UdpSession:
     """
-    Handle client requests and communicate with the peer client.
+    UDP channel of one player, bound to its TCP connection at login.
+
+    The client learns the token from the login response and puts it in
+    every datagram; the address of the latest valid datagram becomes the
+    return address, so a NAT rebinding just moves the channel. Datagrams
+    carry their own sequence number and anything older than the newest one
+    received is dropped, since movement is latest-value-wins.
+    """
+    __slots__ = ("token", "addr", "admit", "recv_seq", "send_seq", "pending_since", "failed")
+
+    def __init__(self, token, admit):
+        self.token = token
+        self.addr = None  # Client address, None until its first datagram arrives
+        self.admit = admit  # RateLimiter shared with the TCP connection
+        self.recv_seq = 0  # Newest datagram sequence number received
+        self.send_seq = 0  # Last datagram sequence number sent
+        self.pending_since = 0.0  # Time of the oldest UDP snapshot not yet acknowledged
+        self.failed = False  # No acks came back, snapshots went back to TCP for good
+
+
+class UdpEndpoint(asyncio.DatagramProtocol):
+    """Datagram protocol of the UDP channel, shared by all sessions of the process."""
+
+    def datagram_received(self, data, addr):
+        receive_datagram(data, addr)
+
+    def error_received(self, exc):
+        log.debug("UDP error: %s", exc)
+
+
+class Match:
+    """
+    State of one two-player match.
+
+    players[0] plays the role of the first client and players[1] the role of
+    the peer, exactly like the two sockets of the original select loop.
+    """
+    __slots__ = ("id", "players", "heroes", "over", "ticks", "seed", "rolls")
+
+    def __init__(self, match_id, client, peer, heroes):
+        self.id = match_id
+        self.players = (client, peer)
+        self.heroes = heroes  # hero_table.HeroTable snapshot, unaffected by catalog reloads
+        self.over = False
+        self.ticks = 0
+        self.seed = random.getrandbits(64)  # Damage rolls of the match derive from this seed
+        self.rolls = 0  # Damage rolls made so far
+
+
+def send_message(player, message):
+    """
+    Send a response in the wire format the player negotiated at login.
+
+    Movement snapshots (type "1") go over the player's UDP channel once it
+    is bound; everything else, including attacks and deaths, stays on TCP.
 
     Args:
-        client_socket (socket.socket): Current client socket.
-        peer_socket (socket.socket): Peer client socket.
-        client_data (dict): Current client data.
-        peer_client_data (dict): Peer client data.
-        heroes (dict): All hero data.
+        player (PlayerState): Receiving player.
+        message (dict): Response built by resp().
 
     Returns:
         None
     """
-    global peer_hero_name, peer_flag, login_received
-    buffer = ""
-    peer_buffer = ""
-    client_login_data = None
-    peer_login_data = None
+    if log.isEnabledFor(logging.DEBUG) and payload_sample():
+        log.debug("Send: %s", Pretty(message))
+    if player.framed:
+        session = player.udp
+        if message["s_resp_type"] == "1" and session is not None and session.addr is not None:
+            if send_datagram(player, session, message):
+                return
+        queue_output(player, protocol.encode_response(message))
+    else:
+        queue_output(player, json.dumps(message, ensure_ascii=False).encode('utf-8'))
+
+
+def queue_output(player, payload):
+    """
+    Queue encoded bytes for a player; they are written by flush_outboxes().
 
+    Everything a player is sent during one event loop iteration (login
+    response, snapshot, queue status) leaves in a single write.
+
+    Args:
+        player (PlayerState): Receiving player.
+        payload (bytes): Encoded message.
+
+    Returns:
+        None
+    """
+    if not player.outbox:
+        if not flush_queue:
+            asyncio.get_running_loop().call_soon(flush_outboxes)
+        flush_queue.append(player)
+    player.outbox.append(payload)
+
+
+def flush_outboxes():
+    """
+    Write the queued output of every player, one write per connection.
+
+    A client whose unsent data exceeds OUTBOX_LIMIT is not keeping up at
+    all; its connection is aborted, which ends its match like a disconnect.
+
+    Returns:
+        None
+    """
+    players = flush_queue[:]
+    flush_queue.clear()
+    for player in players:
+        outbox = player.outbox
+        player.outbox = []
+        writer = player.writer
+        if writer.is_closing():
+            continue
+        writer.write(b"".join(outbox) if len(outbox) > 1 else outbox[0])
+        if writer.transport.get_write_buffer_size() > OUTBOX_LIMIT:
+            log.warning("Client %s is not reading, disconnecting", writer.get_extra_info('peername'))
+            writer.transport.abort()
+
+
+def is_behind(player):
+    """
+    Check whether a client has more unsent output than OUTBOX_HIGH_WATER.
+
+    Args:
+        player (PlayerState): Receiving player.
+
+    Returns:
+        bool: True while the client's connection is backed up.
+    """
+    return player.writer.transport.get_write_buffer_size() > OUTBOX_HIGH_WATER
+
+
+def send_datagram(player, session, message):
+    """
+    Send a movement snapshot over the player's UDP channel.
+
+    If UDP snapshots stay unacknowledged for UDP_FALLBACK_TIMEOUT the
+    return path is assumed blocked and the session stops sending.
+
+    Args:
+        player (PlayerState): Receiving player.
+        session (UdpSession): UDP session of the player.
+        message (dict): Snapshot built by resp().
+
+    Returns:
+        bool: False if the message has to go over TCP instead.
+    """
+    now = time.monotonic()
+    if not session.pending_since:
+        session.pending_since = now
+    elif now - session.pending_since > UDP_FALLBACK_TIMEOUT:
+        log.info("UDP snapshots to %s are not acknowledged, falling back to TCP", session.addr)
+        session.addr = None
+        session.failed = True
+        return False
+    session.send_seq += 1
+    udp_transport.sendto(protocol.pack_datagram(session.token, session.send_seq, protocol.encode_response(message)),
+                         session.addr)
+    return True
+
+
+def receive_datagram(data, addr):
+    """
+    Handle one datagram of the UDP channel.
+
+    Only movement and acks are accepted; they are rate limited together with
+    the player's TCP messages and then dispatched like them. Datagrams with
+    an unknown token, a stale sequence number or any other request are
+    dropped.
+
+    Args:
+        data (bytes): Datagram payload.
+        addr (tuple): Sender address.
+
+    Returns:
+        None
+    """
+    try:
+        token, seq, frame = protocol.unpack_datagram(data)
+    except ValueError:
+        return
+    player = udp_sessions.get(token)
+    if player is None:
+        return
+    session = player.udp
+    if seq <= session.recv_seq:
+        return  # Late or duplicated, a newer update already arrived
+    if frame[0] != protocol.KIND_REQUEST or len(frame) < 2:
+        return
+    opr_type = str(frame[1])
+    if opr_type not in UDP_REQUEST_TYPES or not session.admit(opr_type):
+        return
+    try:
+        message = protocol.decode_frame(frame)
+    except ValueError:
+        return
+    session.recv_seq = seq
+    if session.addr != addr and not session.failed:
+        log.info("UDP channel of %s bound to %s", player.writer.get_extra_info('peername'), addr)
+        session.addr = addr
+    if log.isEnabledFor(logging.DEBUG) and payload_sample():
+        log.debug("Received datagram: %s", Pretty(message))
+    dispatch(player, message)
+
+
+def open_udp_session(player, admit):
+    """
+    Give a player who asked for it at login a UDP session.
+
+    The session token and port go to the client in a type "5" response,
+    sent as a JSON frame since only this one message ever carries them.
+
+    Args:
+        player (PlayerState): Logged-in player.
+        admit (RateLimiter): Rate limiter of the player's connection.
+
+    Returns:
+        None
+    """
+    if udp_transport is None or not player.framed or not player.login.get("udp"):
+        return
+    token = secrets.randbits(64)
+    while not token or token in udp_sessions:
+        token = secrets.randbits(64)
+    player.udp = UdpSession(token, admit)
+    udp_sessions[token] = player
+    queue_output(player, protocol.encode_json({
+        "s_resp_type": "5",
+        "udp_port": udp_transport.get_extra_info('sockname')[1],
+        "udp_token": format(token, "016x"),
+    }))
+
+
+def close_udp_session(player):
+    """Forget the UDP session of a disconnecting player."""
+    if player.udp is not None:
+        udp_sessions.pop(player.udp.token, None)
+        player.udp = None
+
+
+async def wait_for_login(reader, decoder, player, heroes):
+    """
+    Read from a new connection until its login message arrives.
+
+    Args:
+        reader (asyncio.StreamReader): Client stream reader.
+        decoder (protocol.MessageDecoder): Decoder of the connection.
+        player (PlayerState): Player of the connection, receives the login.
+        heroes (hero_table.HeroTable): All hero data.
+
+    Returns:
+        list[dict]|None: Messages received after the login in the same read,
+        or None if the client disconnected or chose an unknown hero.
+    """
     while True:
-        ready_sockets, _, _ = select.select([client_socket, peer_socket], [], [])
-
-        for sock in ready_sockets:
-            if sock == client_socket:
-                request = client_socket.recv(4096)
-                if request:
-                    buffer += request.decode('utf-8')
-
-                    try:
-                        data, index = json.JSONDecoder().raw_decode(buffer)
-                        buffer = buffer[index:].strip()
-                        print(f"Received data: {json.dumps(data, indent=4, ensure_ascii=False)}")
-
-                        if data['opr_type'] == "0":  # Login
-                            client_login_data = data
-                            if peer_login_data:
-                                process_data(client_login_data, peer_login_data, client_socket, peer_socket,
-                                             client_data, peer_client_data, heroes)
-                                login_received = True
-                        elif login_received:
-                            process_data(data, None, client_socket, peer_socket, client_data, peer_client_data, heroes)
-                    except json.JSONDecodeError:
-                        continue
-                else:
-                    break
-            elif sock == peer_socket:
-                peer_request = peer_socket.recv(4096)
-                if peer_request:
-                    peer_buffer += peer_request.decode('utf-8')
-
-                    try:
-                        peer_data, peer_index = json.JSONDecoder().raw_decode(peer_buffer)
-                        peer_buffer = peer_buffer[peer_index:].strip()
-                        print(f"Received peer data: {json.dumps(peer_data, indent=4, ensure_ascii=False)}")
-
-                        if peer_data['opr_type'] == "0":  # Peer login
-                            peer_login_data = peer_data
-                            if client_login_data:
-                                process_data(client_login_data, peer_login_data, client_socket, peer_socket,
-                                             client_data, peer_client_data, heroes)
-                                login_received = True
-                        elif login_received:
-                            process_data(None, peer_data, client_socket, peer_socket, client_data, peer_client_data,
-                                         heroes)
-                    except json.JSONDecodeError:
-                        continue
-                else:
-                    break
-
-def process_data(data, peer_data, client_socket, peer_socket, client_data, peer_client_data, heroes):
-    """
-    Process received data and perform corresponding actions.
-
-    Args:
-        data (dict): Current client data.
-        peer_data (dict): Peer client data.
-        client_socket (socket.socket): Current client socket.
-        peer_socket (socket.socket): Peer client socket.
-        client_data (dict): Current client data.
-        peer_client_data (dict): Peer client data.
-        heroes (dict): All hero data.
-
-    Returns:
-        None
-    """
-    global peer_hero_name, peer_flag
-    global hero_health, peer_health
-    global healthy_flag
-
-    healthy_flag = False
-    peer_opr_type = -1
-    opr_type = -1
-    response = {}
-    peer_response = {}
-
-    if data is not None and 'opr_type' in data:
-        opr_type = data['opr_type']
-        hero_name = data['hero_name']
-    if peer_data is not None and 'opr_type' in peer_data:
-        peer_opr_type = peer_data['opr_type']
-        peer_hero_name = peer_data['hero_name']
-
-    if opr_type == "0":  # Login
-        start_time = time.time()
-        while not peer_hero_name and time.time() - start_time < 5:
-            time.sleep(0.1)  # Short sleep to avoid busy waiting
-
-        peer_health = heroes[peer_hero_name].base_health
-        hero_health = heroes[hero_name].base_health
-        response = resp("0", hero_name, heroes[hero_name].base_health, peer_hero_name,
-                        heroes[peer_hero_name].base_health, "", "", "", "", "", "", "")
-        peer_response = resp("0", peer_hero_name, heroes[peer_hero_name].base_health, hero_name,
-                             heroes[hero_name].base_health, "", "", "", "", "", "", "")
-        print(f"Send to first client: {json.dumps(response, indent=4, ensure_ascii=False)}")
-        client_socket.send(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-        print(f"Send to second client: {json.dumps(peer_response, indent=4, ensure_ascii=False)}")
-        peer_socket.send(json.dumps(peer_response, ensure_ascii=False).encode('utf-8'))
-
-    if opr_type == "1":  # Movement update
-        response = resp("1", hero_name, "", "peer_hero_name",
-                        "", data['hero_x'], data['hero_y'], "", "", "", "", "")
-        peer_response = resp("1", "peer_hero_name", "", hero_name,
-                             "", "", "", data['hero_x'], data['hero_y'], "", "", "")
-        print(f"Send movement info: {json.dumps(response, indent=4, ensure_ascii=False)}")
-        client_socket.send(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-        print(f"Send movement info to peer: {json.dumps(peer_response, indent=4, ensure_ascii=False)}")
-        peer_socket.send(json.dumps(peer_response, ensure_ascii=False).encode('utf-8'))
-
-    if peer_opr_type == "1":  # Peer movement update
-        peer_response = resp("1", "hero_name", "", peer_hero_name,
-                             "", peer_data['hero_x'], peer_data['hero_y'], "", "", "", "", "")
-        response = resp("1", "peer_hero_name", "", "hero_name",
-                        "", "", "", peer_data['hero_x'], peer_data['hero_y'], "", "", "")
-        print(f"Send movement info: {json.dumps(response, indent=4, ensure_ascii=False)}")
-        client_socket.send(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-        print(f"Send movement info to peer: {json.dumps(peer_response, indent=4, ensure_ascii=False)}")
-        peer_socket.send(json.dumps(peer_response, ensure_ascii=False).encode('utf-8'))
-
-    if peer_opr_type == "2":  # Peer attack
-        skill_index = int(peer_data['hero_skill']) if peer_data['hero_skill'] else 0
-        hero = heroes[peer_hero_name]
-        skill = hero.skills[skill_index]
-        damage = calculate_damage(skill, hero)
-        hero_health -= damage
-        if hero_health <= 0:
-            healthy_flag = True
-            response = resp("2", "111", "0", peer_hero_name,
-                            peer_health, "", "", "", "", str(skill_index),
-                            "99", healthy_flag)
-            peer_response = resp("2", peer_hero_name, peer_health, "111",
-                                 "0", "", "", "", "", str(skill_index),
-                                 "99", "")
+        request = await reader.read(4096)
+        if not request:
+            return None
+        messages = decoder.feed(request)
+        for i, data in enumerate(messages):
+            if data.get('opr_type') != "0":
+                continue  # Nothing to do before the login
+            return messages[i + 1:] if accept_login(player, data, heroes) else None
+
+
+def accept_login(player, data, heroes):
+    """
+    Check a login message and store it on the player.
+
+    Args:
+        player (PlayerState): Player of the connection.
+        data (dict): Login message.
+        heroes (hero_table.HeroTable): All hero data.
+
+    Returns:
+        bool: False if the login names an unknown hero or carries a rating
+        that is not a number.
+    """
+    if data.get('hero_name') not in heroes:
+        log.warning("Unknown hero in login: %r", data.get('hero_name'))
+        return False
+    try:
+        int(data.get('rating') or DEFAULT_RATING)  # Matchmaker.bracket() relies on it
+    except (TypeError, ValueError, OverflowError):
+        log.warning("Bad rating in login: %r", data.get('rating'))
+        return False
+    player.login = data
+    player.hero_name = data['hero_name']
+    player.framed = data.get("wire") == protocol.WIRE_VERSION
+    return True
+
+
+def resp_queue(position, eta):
+    """
+    Build a queue status response (type "4").
+
+    Args:
+        position (int): 1-based position in the matchmaking queue.
+        eta (int|str): Estimated seconds until a match starts, "" if unknown.
+
+    Returns:
+        dict: Response data.
+    """
+    response = resp("4", "", "", "", "", "", "", "", "", "", "", "")
+    response["queue_pos"] = position
+    response["queue_eta"] = eta
+    return response
+
+
+class _QueueBucket:
+    """
+    FIFO queue of players waiting in one matchmaking bracket.
+
+    Every player gets an increasing ticket number. A Fenwick tree over the
+    tickets counts the players still waiting, so a player's queue position
+    and the removal of a player who disconnected both cost O(log n).
+    """
+    __slots__ = ("players", "base", "tree", "alive")
+
+    def __init__(self):
+        self.players = deque()  # Waiting players in ticket order, may contain removed ones
+        self.base = 0  # Ticket number stored at tree index 1
+        self.tree = [0]  # Fenwick tree (1-based) of alive flags per ticket
+        self.alive = 0
+
+    def _prefix(self, index):
+        tree = self.tree
+        total = 0
+        while index > 0:
+            total += tree[index]
+            index &= index - 1
+        return total
+
+    def _update(self, index, delta):
+        tree = self.tree
+        while index < len(tree):
+            tree[index] += delta
+            index += index & -index
+
+    def push(self, player):
+        """Append a player and give it the next ticket."""
+        if not self.alive:
+            # Empty queue: restart the ticket space so the tree never grows unbounded
+            self.players.clear()
+            self.base += len(self.tree) - 1
+            self.tree = [0]
+        index = len(self.tree)
+        # Appending to a Fenwick tree: the new node covers (index - lowbit, index]
+        self.tree.append(1 + self._prefix(index - 1) - self._prefix(index - (index & -index)))
+        player.ticket = self.base + index
+        self.players.append(player)
+        self.alive += 1
+
+    def remove(self, player):
+        """Mark a waiting player as gone; it is skipped when reached."""
+        self._update(player.ticket - self.base, -1)
+        player.ticket = 0
+        self.alive -= 1
+
+    def pop(self):
+        """Remove and return the longest-waiting player."""
+        players = self.players
+        while True:
+            player = players.popleft()
+            if player.ticket:
+                self.remove(player)
+                return player
+
+    def first(self):
+        """Longest-waiting player, left in the queue."""
+        for player in self.players:
+            if player.ticket:
+                return player
+        return None
+
+    def position(self, player):
+        """1-based position of a waiting player in this bucket."""
+        return self._prefix(player.ticket - self.base)
+
+
+class Matchmaker:
+    """
+    Matchmaking queue between login and the match runner.
+
+    Logged-in players are queued per bracket (everyone, same hero, or same
+    rating band) and paired first-come first-served. Pairs are handed to the
+    runner callback as long as fewer than max_matches matches are running;
+    the others keep waiting and get their queue position and an ETA.
+    """
+
+    def __init__(self, runner, mode="any", max_matches=0):
+        """
+        Args:
+            runner (callable): runner(client, peer) starts a match for a pair.
+            mode (str): "any", "hero" or "rating" bracket selection.
+            max_matches (int): Concurrent match limit, 0 for no limit.
+        """
+        self.runner = runner
+        self.mode = mode
+        self.max_matches = max_matches
+        self.running = 0
+        self.buckets = {}
+        self.pair_interval = 0.0  # Smoothed seconds between two match starts
+        self.last_pair = None
+
+    def bracket(self, player):
+        """Bracket key of a player for the configured mode."""
+        if self.mode == "hero":
+            return player.hero_name
+        if self.mode == "rating":
+            rating = player.login.get("rating") or DEFAULT_RATING
+            return int(rating) // RATING_BRACKET
+        return None
+
+    def enqueue(self, player):
+        """Queue a logged-in player and start matches if possible."""
+        key = self.bracket(player)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = _QueueBucket()
+        player.bracket = key
+        player.queued_at = time.monotonic()
+        bucket.push(player)
+        self.pump(key)
+        if player.ticket:
+            self.report(player)
+
+    def remove(self, player):
+        """Take a disconnected player out of its queue."""
+        if player.ticket:
+            bucket = self.buckets[player.bracket]
+            bucket.remove(player)
+            if not bucket.alive:
+                del self.buckets[player.bracket]
+
+    def finished(self):
+        """Release the capacity of a finished match and pair waiting players."""
+        self.running -= 1
+        for key in list(self.buckets):
+            self.pump(key)
+
+    def pump(self, key):
+        """Pair players of one bracket while capacity allows."""
+        bucket = self.buckets.get(key)
+        while bucket is not None and bucket.alive >= 2:
+            if self.max_matches and self.running >= self.max_matches:
+                return
+            client = bucket.pop()
+            peer = bucket.pop()
+            self.running += 1
+            self._record_pair()
+            self.runner(client, peer)
+        if bucket is not None and not bucket.alive:
+            del self.buckets[key]
+
+    def _record_pair(self):
+        now = time.monotonic()
+        if self.last_pair is not None:
+            interval = now - self.last_pair
+            self.pair_interval = interval if not self.pair_interval else 0.8 * self.pair_interval + 0.2 * interval
+        self.last_pair = now
+
+    def report(self, player):
+        """Send a waiting player its queue position and ETA if they changed."""
+        position = self.buckets[player.bracket].position(player)
+        eta = round((position + 1) // 2 * self.pair_interval) if self.pair_interval else ""
+        if player.reported != (position, eta):
+            player.reported = (position, eta)
+            send_message(player, resp_queue(position, eta))
+
+    def lonely(self, min_wait):
+        """Brackets whose only waiting player has been waiting for at least min_wait seconds."""
+        now = time.monotonic()
+        return [key for key, bucket in self.buckets.items()
+                if bucket.alive == 1 and now - bucket.first().queued_at >= min_wait]
+
+    @property
+    def queued(self):
+        """Number of players waiting in all brackets."""
+        return sum(bucket.alive for bucket in self.buckets.values())
+
+    def report_all(self):
+        """Refresh the queue status of every waiting player."""
+        for bucket in self.buckets.values():
+            for player in bucket.players:
+                if player.ticket:
+                    self.report(player)
+
+
+def start_match(client, peer, catalog):
+    """
+    Match runner: create the match for a pair chosen by the matchmaker.
+
+    The match takes the catalog's current hero table and keeps it until it
+    ends, so a reload only affects matches started afterwards.
+
+    Args:
+        client (PlayerState): First player of the pair.
+        peer (PlayerState): Second player of the pair.
+        catalog (hero_table.Catalog): Hero catalog.
+
+    Returns:
+        None
+    """
+    global match_counter
+    match_counter += 1
+    heroes = catalog.get()
+    match = Match(match_counter, client, peer, heroes)
+    client.match = peer.match = match
+    for p in match.players:
+        if p.hero_name not in heroes:
+            # Removed by a reload while the player was queued; the matchmaker is still pairing, so defer
+            log.warning("Match %d cancelled: hero %s is no longer in the catalog", match.id, p.hero_name)
+            asyncio.get_running_loop().call_soon(leave_match, p)
+            return
+        p.hero_id = heroes.by_name(p.hero_name).id
+        p.ready_at = [0.0] * heroes[p.hero_id].skill_count
+    process_login(match)
+    active_matches.add(match)
+
+
+def end_match(match):
+    """
+    Stop simulating a match and give its slot back to the matchmaker.
+
+    Args:
+        match (Match): Match that is over.
+
+    Returns:
+        None
+    """
+    if match.over:
+        return
+    match.over = True
+    active_matches.discard(match)
+    matchmaker.finished()
+
+
+def leave_match(player):
+    """
+    Release everything a disconnecting player holds.
+
+    A queued player leaves the matchmaking queue; a player in a match ends
+    the match and disconnects the opponent.
+
+    Args:
+        player (PlayerState): Disconnecting player.
+
+    Returns:
+        None
+    """
+    matchmaker.remove(player)
+    if player.match is not None:
+        close_match(player.match)
+
+
+def close_match(match):
+    """
+    End a match and disconnect both of its players.
+
+    Args:
+        match (Match): Match to close.
+
+    Returns:
+        None
+    """
+    end_match(match)
+    for p in match.players:
+        if not p.writer.is_closing():
+            p.writer.close()
+
+
+def dispatch(player, data):
+    """
+    Route one decoded client message.
+
+    Movement and attacks are queued on the player and applied by the next
+    simulation tick; they are dropped while the player has no running match.
+
+    Args:
+        player (PlayerState): Player who sent the message.
+        data (dict): Decoded client message.
+
+    Returns:
+        None
+    """
+    match = player.match
+    if match is not None and not match.over and data.get('opr_type') != "0":
+        process_data(data, player)
+
+
+def process_login(match):
+    """
+    Initialise both players of a match and send them the login response.
+
+    Args:
+        match (Match): Match whose players both logged in.
+
+    Returns:
+        None
+    """
+    client, peer = match.players
+    heroes = match.heroes
+    client.health = heroes[client.hero_id].base_health
+    peer.health = heroes[peer.hero_id].base_health
+
+    response = resp("0", client.hero_name, client.health, peer.hero_name,
+                    peer.health, "", "", "", "", "", "", "")
+    response["s_hero1_id"], response["s_hero2_id"] = client.hero_id, peer.hero_id
+    peer_response = resp("0", peer.hero_name, peer.health, client.hero_name,
+                         client.health, "", "", "", "", "", "", "")
+    peer_response["s_hero1_id"], peer_response["s_hero2_id"] = peer.hero_id, client.hero_id
+    log.info("Match %d started: %s vs %s", match.id, client.hero_name, peer.hero_name)
+    send_message(client, response)
+    send_message(peer, peer_response)
+
+
+def process_data(data, player):
+    """
+    Queue a movement or attack message for the next simulation tick.
+
+    Movement is latest-value-wins, so key repeat between two ticks costs one
+    assignment each; attacks are kept in arrival order, except casts of a
+    skill that is still cooling down, which are dropped. Snapshot
+    acknowledgements (opr_type "3" or an "ack" field on any message) move the
+    client's delta baseline forward.
+
+    Numbers are checked here, when the message arrives: a message with a
+    missing or non-integer position, input number, skill or ack, or one that
+    does not fit the wire format's 32-bit numbers, is dropped as a whole, so
+    it can neither reach the tick loop nor break the snapshots it ends up in.
+    Positions are kept as normalised strings, the form snapshots send.
+
+    Args:
+        data (dict): Decoded client message.
+        player (PlayerState): Player who sent the message.
+
+    Returns:
+        None
+    """
+    opr_type = data.get('opr_type')
+    try:
+        ack = wire_number(data.get('ack') or 0)
+        if opr_type == "1":  # Movement update
+            input_seq = data.get('input_seq', "")
+            move = (str(wire_number(data['hero_x'])), str(wire_number(data['hero_y'])),
+                    str(wire_number(input_seq)) if input_seq != "" else "")
+        elif opr_type == "2":  # Attack
+            skill_index = wire_number(data.get('hero_skill') or 0)
+    except (KeyError, TypeError, ValueError):
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Dropped malformed message: %s", Pretty(data))
+        return
+    if ack:
+        acknowledge(player, ack)
+    if opr_type == "1":
+        player.move = move
+    elif opr_type == "2":
+        if ready_to_cast(player, skill_index):
+            player.attacks.append(skill_index)
+
+
+def wire_number(value):
+    """
+    Convert a number from a client message, refusing what snapshots cannot carry.
+
+    Args:
+        value (str|int): Number as received.
+
+    Returns:
+        int: The number.
+
+    Raises:
+        ValueError: If the value is not an integer or outside the 32-bit
+            range of the wire format.
+        TypeError: If the value is not a string or a number.
+    """
+    number = int(value)
+    if not protocol.NUMBER_MIN <= number <= protocol.NUMBER_MAX:
+        raise ValueError(f"Number out of range: {number}")
+    return number
+
+
+def ready_to_cast(player, skill_index):
+    """
+    Check a skill's cooldown and start it again if the skill can be cast.
+
+    Args:
+        player (PlayerState): Casting player.
+        skill_index (int): Skill the player wants to cast.
+
+    Returns:
+        bool: False for an unknown skill or one still cooling down.
+    """
+    ready_at = player.ready_at
+    if not 0 <= skill_index < len(ready_at):
+        return False
+    now = time.monotonic()
+    if now < ready_at[skill_index]:
+        return False
+    ready_at[skill_index] = now + player.match.heroes[player.hero_id].cooldown[skill_index] - COOLDOWN_SLACK
+    return True
+
+
+def acknowledge(player, seq):
+    """
+    Record that a client received the snapshot with the given sequence number.
+
+    Args:
+        player (PlayerState): Acknowledging player.
+        seq (int): Snapshot sequence number.
+
+    Returns:
+        None
+    """
+    if seq <= player.acked or seq > player.seq:
+        return
+    player.acked = seq
+    if player.udp is not None:
+        player.udp.pending_since = 0.0
+    history = player.history
+    for old in [s for s in history if s < seq]:
+        del history[old]
+
+
+def send_snapshot(match, player, state, skill, p_skill):
+    """
+    Send a player the fields of its view of the match that changed.
+
+    Framed clients get deltas against the last snapshot they acknowledged;
+    every snapshot carries its sequence number and the one of its baseline
+    (base_seq), so the client fills the unchanged fields in from that
+    snapshot rather than from whatever it received last. JSON clients cannot
+    acknowledge, so their baseline is the last snapshot sent (TCP delivers it
+    in order).
+    A full keyframe is sent every KEYFRAME_INTERVAL ticks or when no baseline
+    is available. Movement-only snapshots for a client whose TCP connection is
+    backed up are skipped rather than queued, since the next one supersedes
+    them anyway.
+
+    Args:
+        match (Match): Match the player plays in.
+        player (PlayerState): Receiving player.
+        state (tuple): (health, peer health, x, y, peer x, peer y, input seq) as seen by the player.
+        skill (str): Skill the player cast this tick, "99" for none, "" if no attack happened.
+        p_skill (str): Skill the opponent cast this tick, same encoding.
+
+    Returns:
+        None
+    """
+    history = player.history
+    keyframe_due = match.ticks - player.keyframe_tick >= KEYFRAME_INTERVAL
+    if not skill and not keyframe_due and history.get(player.seq) == state:
+        return  # Nothing happened since the last snapshot
+    if not skill and (player.udp is None or player.udp.addr is None) and is_behind(player):
+        return  # Backed-up client: the next snapshot it can take carries the newest positions
+
+    base_seq = player.acked if player.framed else player.seq
+    baseline = history.get(base_seq)
+    if baseline is None or keyframe_due:
+        player.keyframe_tick = match.ticks
+        base_seq = ""
+        changed = [i for i, value in enumerate(state) if value != ""]
+    else:
+        changed = [i for i, value in enumerate(state) if value != baseline[i]]
+    if not changed and not skill and not player.framed:
+        return  # An empty delta still tells a framed client that the state went back to its baseline
+
+    values = [""] * len(state)
+    for i in changed:
+        values[i] = state[i]
+    health, p_health, x, y, p_x, p_y, input_seq = values
+    snapshot = resp("2" if skill else "1", "", health, "", p_health, x, y, p_x, p_y, skill, p_skill,
+                    True if skill and state[0] == "0" else "")
+    if input_seq != "":
+        snapshot["s_input_seq"] = input_seq
+
+    player.seq += 1
+    history[player.seq] = state
+    if player.framed:
+        snapshot["seq"] = player.seq
+        snapshot["base_seq"] = base_seq
+        if len(history) > SNAPSHOT_HISTORY:
+            del history[next(iter(history))]
+    else:
+        history.pop(player.seq - 1, None)
+    send_message(player, snapshot)
+
+
+def begin_tick(match, batch, targets):
+    """
+    First half of a simulation step: apply movement and queue the attacks.
+
+    Attacks of all matches are collected in one damage.AttackBatch and
+    resolved together by run_ticks() before finish_tick() runs.
+
+    Args:
+        match (Match): Match to advance.
+        batch (damage.AttackBatch): Attacks of this tick.
+        targets (list[PlayerState]): Players in target slot order, extended here.
+
+    Returns:
+        None
+    """
+    players = match.players
+    match.ticks += 1
+
+    for player in players:
+        if player.move is not None:
+            player.x, player.y, player.input_seq = player.move
+            player.move = None
+
+    for side, player in enumerate(players):
+        if not player.attacks:
+            continue
+        means = match.heroes[player.hero_id].mean
+        target = players[1 - side]
+        slot = batch.add_target(target.health)
+        targets.append(target)
+        for skill_index in player.attacks:
+            batch.add(means[skill_index], slot, match.seed, match.rolls)
+            match.rolls += 1
+
+
+def finish_tick(match):
+    """
+    Second half of a simulation step, after the damage has been applied.
+
+    Sends each client at most one snapshot with the fields that changed:
+    type "2" when an attack happened (with the skills cast), otherwise "1".
+
+    Args:
+        match (Match): Match to advance.
+
+    Returns:
+        None
+    """
+    players = match.players
+    # "99" means no skill was cast this tick
+    casts = [str(player.attacks[-1]) if player.attacks else "99" for player in players]
+    attacked = bool(players[0].attacks or players[1].attacks)
+    for player in players:
+        player.attacks.clear()
+
+    for side, player in enumerate(players):
+        other = 1 - side
+        opponent = players[other]
+        # Health is sent as a string so that "0" is not mistaken for "unchanged"
+        state = (str(player.health), str(opponent.health), player.x, player.y, opponent.x, opponent.y,
+                 player.input_seq)
+        if attacked:
+            send_snapshot(match, player, state, casts[side], casts[other])
         else:
-            response = resp("2", "111", hero_health, peer_hero_name,
-                            peer_health, "", "", "", "", str(skill_index),
-                            "99", healthy_flag)
-            peer_response = resp("2", peer_hero_name, peer_health, "111",
-                                 hero_health, "", "", "", "", str(skill_index),
-                                 "99", "")
-        client_socket.send(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-        peer_socket.send(json.dumps(peer_response, ensure_ascii=False).encode('utf-8'))
-
-    if opr_type == "2":  # Attack
-        skill_index = int(data['hero_skill']) if data['hero_skill'] else 0
-        hero = heroes[hero_name]
-        skill = hero.skills[skill_index]
-        damage = calculate_damage(skill, hero)
-        peer_health -= damage
-        if peer_health <= 0:
-            healthy_flag = True
-            response = resp("2", hero_name, hero_health, peer_hero_name,
-                            "0", "", "", "", "", str(skill_index),
-                            "99", "")
-            peer_response = resp("2", peer_hero_name, "0", hero_name,
-                                 hero_health, "", "", "", "", str(skill_index),
-                                 "99", healthy_flag)
+            send_snapshot(match, player, state, "", "")
+
+    if players[0].health <= 0 or players[1].health <= 0:
+        end_match(match)
+
+
+async def run_ticks(tick_rate):
+    """
+    Run the authoritative simulation loop for all active matches.
+
+    One loop drives every match at a fixed rate, so server work follows game
+    time instead of the clients' key-repeat rate. The attacks of all matches
+    in a tick are resolved as one batch (vectorized when NumPy is installed).
+
+    Args:
+        tick_rate (int): Simulation steps per second.
+
+    Returns:
+        None
+    """
+    loop = asyncio.get_running_loop()
+    interval = 1.0 / tick_rate
+    next_tick = loop.time()
+    while True:
+        next_tick += interval
+        delay = next_tick - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif delay < -interval:
+            next_tick = loop.time()  # Fell behind: skip missed ticks instead of bursting
+        matches = []
+        batch = damage.AttackBatch()
+        targets = []
+        for match in list(active_matches):
+            try:
+                begin_tick(match, batch, targets)
+                matches.append(match)
+            except Exception:
+                log.exception("Match %d tick failed", match.id)
+                close_match(match)  # Its clients would wait for snapshots that never come
+        if batch:
+            health = batch.resolve()[1]
+            for player, value in zip(targets, health):
+                player.health = value
+        for match in matches:
+            try:
+                finish_tick(match)
+            except Exception:
+                log.exception("Match %d tick failed", match.id)
+                close_match(match)
+
+
+async def handle_client(reader, writer, catalog, login=None, pending=b""):
+    """
+    Serve one client connection from login to the end of its match.
+
+    A connection has LOGIN_TIMEOUT seconds to log in, otherwise it is closed
+    without ever holding a match slot. Logged-in players are handed to the
+    matchmaker, and every match keeps its own state, so any number of matches
+    can run concurrently in one process. A connection handed over by another
+    worker (see adopt_client()) arrives logged in already.
+
+    Args:
+        reader (asyncio.StreamReader): Client stream reader.
+        writer (asyncio.StreamWriter): Client stream writer.
+        catalog (hero_table.Catalog): Hero catalog.
+        login (dict|None): Login message of a handed-over connection.
+        pending (bytes): Bytes of a handed-over connection the previous worker had not decoded.
+
+    Returns:
+        None
+    """
+    global connection_count
+    address = writer.get_extra_info('peername')
+    if login is None:
+        log.info("Client connected from: %s", address)
+    else:
+        log.info("Client %s handed over from another worker", address)
+    sock = writer.get_extra_info('socket')
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Flushes are already coalesced
+    connection_count += 1
+    player = PlayerState(writer, reader)
+    limiter = RateLimiter()
+    decoder = protocol.MessageDecoder(admit=limiter)
+    try:
+        if login is None:
+            backlog = await asyncio.wait_for(wait_for_login(reader, decoder, player, catalog.get()),
+                                             LOGIN_TIMEOUT)
         else:
-            response = resp("2", hero_name, hero_health, peer_hero_name,
-                            peer_health, "", "", "", "", str(skill_index),
-                            "99", healthy_flag)
-            peer_response = resp("2", peer_hero_name, peer_health, hero_name,
-                                 hero_health, "", "", "", "", str(skill_index),
-                                 "99", healthy_flag)
-        client_socket.send(json.dumps(response, ensure_ascii=False).encode('utf-8'))
-        peer_socket.send(json.dumps(peer_response, ensure_ascii=False).encode('utf-8'))
+            backlog = decoder.feed(pending) if accept_login(player, login, catalog.get()) else None
+        if backlog is None:
+            return
+        if login is None:
+            # A handed-over client is bound to the UDP port of its first worker and stays on TCP
+            open_udp_session(player, limiter)
+        matchmaker.enqueue(player)
+        for data in backlog:
+            dispatch(player, data)
+
+        while True:
+            request = await reader.read(4096)
+            if not request:
+                break
+            for data in decoder.feed(request):
+                if log.isEnabledFor(logging.DEBUG) and payload_sample():
+                    log.debug("Received data: %s", Pretty(data))
+                dispatch(player, data)
+    except asyncio.TimeoutError:
+        log.info("Client %s did not log in within %g s", address, LOGIN_TIMEOUT)
+    except (ConnectionError, ValueError) as e:
+        log.warning("Client %s error: %s", address, e)
+    finally:
+        connection_count -= 1
+        leave_match(player)
+        close_udp_session(player)
+        if player.handoff is not None:
+            send_handoff(player, decoder)
+        if not writer.is_closing():
+            writer.close()
+        if decoder.dropped:
+            log.info("Client %s: %d messages dropped by rate limiting", address, decoder.dropped)
+        if player.handoff is None:
+            log.info("Client %s disconnected", address)
 
 
-def start_server():
+def request_handoff(bracket, target):
     """
-    Start the server, wait for client connections, and handle requests.
+    Start handing the player waiting alone in a bracket over to another worker.
+
+    Reading stops and handle_client() sees the end of the stream once it has
+    decoded what was already read; it then calls send_handoff(). Bytes not
+    read yet stay in the socket for the new worker.
+
+    Args:
+        bracket: Matchmaking bracket key.
+        target (int): Worker number that takes the player.
+
+    Returns:
+        None
+    """
+    bucket = matchmaker.buckets.get(bracket)
+    if bucket is None or bucket.alive != 1:
+        return  # Paired or gone since the last report
+    player = bucket.first()
+    if player.outbox or player.writer.transport.get_write_buffer_size():
+        return  # Unsent output would mix with the new worker's; the next report retries
+    matchmaker.remove(player)
+    player.handoff = target
+    player.writer.transport.pause_reading()
+    player.reader.feed_eof()
+
+
+def send_handoff(player, decoder):
+    """
+    Pass a player's connection to the supervisor, which forwards it to player.handoff.
+
+    The socket goes along as a file descriptor, together with the login and
+    the bytes of an incomplete message; closing this worker's copy of the
+    socket afterwards does not end the connection.
+
+    Args:
+        player (PlayerState): Player removed from the queue by request_handoff().
+        decoder (protocol.MessageDecoder): Decoder of the connection.
+
+    Returns:
+        None
+    """
+    fd = os.dup(player.writer.get_extra_info('socket').fileno())
+    try:
+        control_channel.send({"type": "handoff", "to": player.handoff, "login": player.login,
+                              "pending": decoder.pending()})
+        multiprocessing.reduction.send_handle(control_channel, fd, os.getppid())
+        log.info("Client %s handed over to worker %d", player.writer.get_extra_info('peername'), player.handoff)
+    except OSError as e:
+        log.warning("Cannot hand client %s over: %s", player.writer.get_extra_info('peername'), e)
+    finally:
+        os.close(fd)
+    player.writer.transport.abort()  # Drops output queued since, the new worker owns the stream now
+
+
+async def adopt_client(fd, message, catalog):
+    """
+    Serve a connection handed over by another worker.
+
+    Args:
+        fd (int): Socket file descriptor received from the supervisor.
+        message (dict): Handoff message with the login and the undecoded bytes.
+        catalog (hero_table.Catalog): Hero catalog.
+
+    Returns:
+        None
+    """
+    try:
+        reader, writer = await asyncio.open_connection(sock=socket.socket(fileno=fd))
+    except OSError as e:
+        log.warning("Cannot take over a handed-over client: %s", e)
+        return
+    await handle_client(reader, writer, catalog, message["login"], message["pending"])
+
+
+async def report_queue(interval=QUEUE_REPORT_INTERVAL):
+    """
+    Periodically tell queued players their position and ETA.
+
+    Args:
+        interval (float): Seconds between two reports.
+
+    Returns:
+        None
+    """
+    while True:
+        await asyncio.sleep(interval)
+        matchmaker.report_all()
+
+
+def supervisor_gone(stopped, index, reason):
+    """
+    Stop a worker whose supervisor died, instead of serving on as an orphan.
+
+    Args:
+        stopped (asyncio.Future): Resolved when the worker has to stop.
+        index (int): Worker number.
+        reason: What showed that the supervisor is gone.
+
+    Returns:
+        None
+    """
+    if not stopped.done():
+        log.error("Supervisor is gone (%s), worker %d stops", reason, index)
+        stopped.set_result(None)
+
+
+def read_control(control, catalog, stopped, index):
+    """
+    Handle a message from the supervisor; event loop reader callback of a worker.
+
+    "handoff" asks to move the player waiting alone in a bracket to another
+    worker, "adopt" is followed by the socket of a player moved here.
+
+    Args:
+        control (multiprocessing.connection.Connection): Control channel.
+        catalog (hero_table.Catalog): Hero catalog.
+        stopped (asyncio.Future): Resolved when the worker has to stop.
+        index (int): Worker number.
 
     Returns:
         None
     """
-    heroes = Hero.load_from_file()
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    # server.bind(('0.0.0.0', 1212))
-    server.bind((SERVER_HOST, SERVER_PORT))
-    server.listen(2)
+    try:
+        message = control.recv()
+        if message["type"] == "handoff":
+            request_handoff(message["bracket"], message["to"])
+        elif message["type"] == "adopt":
+            fd = multiprocessing.reduction.recv_handle(control)
+            task = asyncio.ensure_future(adopt_client(fd, message, catalog))
+            adopting.add(task)
+            task.add_done_callback(adopting.discard)
+    except (EOFError, OSError) as e:
+        asyncio.get_running_loop().remove_reader(control.fileno())
+        supervisor_gone(stopped, index, str(e) or "control channel closed")
+
+
+async def report_waiting(control, index, stopped, interval=HANDOFF_CHECK_INTERVAL):
+    """
+    Periodically tell the supervisor in which brackets a player waits alone.
 
-    print(f"Server started on {SERVER_HOST}:{SERVER_PORT}, waiting for connections...")
+    Two such players on different workers are never paired by their own
+    matchmakers; the supervisor moves one of them (see pair_waiting()).
+    Reports repeat while a player is still alone, so a handoff that did not
+    happen is retried.
+
+    Args:
+        control (multiprocessing.connection.Connection): Control channel.
+        index (int): Worker number.
+        stopped (asyncio.Future): Resolved when the worker has to stop.
+        interval (float): Seconds between two checks.
 
-    client1_socket, addr1 = server.accept()
-    print(f"Client 1 connected from: {addr1}")
+    Returns:
+        None
+    """
+    reported = []
+    while True:
+        await asyncio.sleep(interval)
+        lonely = matchmaker.lonely(HANDOFF_DELAY)
+        if not lonely and not reported:
+            continue
+        try:
+            control.send({"type": "waiting", "worker": index, "brackets": lonely})
+        except OSError as e:
+            supervisor_gone(stopped, index, e)
+            return
+        reported = lonely
+
+
+async def report_stats(control, index, stopped, interval=STATS_INTERVAL):
+    """
+    Periodically send this worker's load to the supervisor.
+
+    A broken control channel means the supervisor is gone; the worker then
+    stops instead of serving on as an orphan.
+
+    Args:
+        control (multiprocessing.connection.Connection): Control channel.
+        index (int): Worker number.
+        stopped (asyncio.Future): Resolved when the worker has to stop.
+        interval (float): Seconds between two reports.
+
+    Returns:
+        None
+    """
+    while True:
+        try:
+            control.send({
+                "type": "stats",
+                "worker": index,
+                "pid": os.getpid(),
+                "connections": connection_count,
+                "queued": matchmaker.queued,
+                "matches": len(active_matches),
+                "matches_started": match_counter,
+            })
+        except OSError as e:  # BrokenPipeError once the supervisor died
+            supervisor_gone(stopped, index, e)
+            return
+        await asyncio.sleep(interval)
 
-    client2_socket, addr2 = server.accept()
-    print(f"Client 2 connected from: {addr2}")
 
-    client_data = {}
-    peer_client_data = {}
+async def open_udp_endpoint(port):
+    """
+    Bind the UDP channel, or leave it disabled if the port is unavailable.
+
+    Args:
+        port (int): UDP port to bind.
+
+    Returns:
+        None
+    """
+    global udp_transport
+    try:
+        udp_transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            UdpEndpoint, local_addr=(SERVER_HOST, port))
+    except OSError as e:
+        log.warning("UDP channel disabled, cannot bind port %d: %s", port, e)
+        return
+    log.info("UDP channel on %s:%d", SERVER_HOST, port)
+
+
+async def serve(catalog, tick_rate=TICK_RATE, match_by=MATCHMAKING, max_matches=MAX_MATCHES, sock=None,
+                reuse_port=False, control=None, index=0, udp_port=UDP_PORT):
+    """
+    Accept client connections forever and host their matches.
+
+    Args:
+        catalog (hero_table.Catalog): Hero catalog, reloaded when property.json changes.
+        tick_rate (int): Simulation steps per second.
+        match_by (str): Matchmaking bracket mode ("any", "hero" or "rating").
+        max_matches (int): Concurrent match limit, 0 for no limit.
+        sock (socket.socket|None): Listening socket handed over by the supervisor.
+        reuse_port (bool): Bind with SO_REUSEPORT so several workers share the port.
+        control (multiprocessing.connection.Connection|None): Control channel to the supervisor.
+        index (int): Worker number, only used with a control channel.
+        udp_port (int): UDP channel port, plus the worker number; 0 disables the channel.
+
+    Returns:
+        None
+    """
+    global matchmaker, udp_transport, control_channel
+    matchmaker = Matchmaker(lambda client, peer: start_match(client, peer, catalog), match_by, max_matches)
+    if sock is not None:
+        server = await asyncio.start_server(lambda r, w: handle_client(r, w, catalog), sock=sock)
+    else:
+        server = await asyncio.start_server(lambda r, w: handle_client(r, w, catalog), SERVER_HOST, SERVER_PORT,
+                                            backlog=SERVER_BACKLOG, reuse_port=reuse_port or None)
+
+    log.info("Server started on %s:%d (%d Hz), waiting for connections...", SERVER_HOST, SERVER_PORT, tick_rate)
+    if udp_port:
+        await open_udp_endpoint(udp_port + index)
+
+    tasks = [asyncio.create_task(run_ticks(tick_rate)), asyncio.create_task(report_queue())]
+    stopped = None
+    if control is not None:
+        control_channel = control
+        stopped = asyncio.get_running_loop().create_future()
+        tasks.append(asyncio.create_task(report_stats(control, index, stopped)))
+        if HANDOFF_SUPPORTED:
+            asyncio.get_running_loop().add_reader(control.fileno(), read_control, control, catalog, stopped, index)
+            tasks.append(asyncio.create_task(report_waiting(control, index, stopped)))
+    try:
+        async with server:
+            if stopped is None:
+                await server.serve_forever()
+            else:
+                await stopped  # The server keeps serving until the supervisor is gone
+    finally:
+        for task in tasks:
+            task.cancel()
+        flush_queue.clear()
+        if control_channel is not None:
+            if HANDOFF_SUPPORTED and not control_channel.closed:
+                asyncio.get_running_loop().remove_reader(control_channel.fileno())
+            control_channel = None
+        if udp_transport is not None:
+            udp_transport.close()
+            udp_transport = None
+
+
+def worker_main(index, sock, control, settings, inherited=()):
+    """
+    Entry point of a worker process in supervisor mode.
+
+    Every worker runs its own event loop, matchmaker and tick loop, so it owns
+    a disjoint set of matches; players are paired with other players of the
+    same worker. A player left alone in its bracket is moved to a worker
+    where another one waits, through the supervisor (see pair_waiting()).
+
+    Args:
+        index (int): Worker number.
+        sock (socket.socket|None): Shared listening socket, None to bind with SO_REUSEPORT.
+        control (multiprocessing.connection.Connection): Control channel to the supervisor.
+        settings (tuple): (tick_rate, log_level, log_sample, match_by, max_matches, udp_port).
+        inherited (list): Supervisor ends of control channels that fork copied into this process.
+
+    Returns:
+        None
+    """
+    global log
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)  # Forked from the supervisor, whose handler cleans up workers
+    for conn in inherited:
+        conn.close()  # Otherwise the channels stay open after the supervisor dies
+    tick_rate, log_level, log_sample, match_by, max_matches, udp_port = settings
+    log = logging.getLogger(f"arena.server.w{index}")
+    arena_log.setup_logging(log_level)
+    if log_sample:
+        payload_sample.every = log_sample
+    catalog = load_catalog()
+    try:
+        asyncio.run(serve(catalog, tick_rate, match_by, max_matches, sock=sock, reuse_port=sock is None,
+                          control=control, index=index, udp_port=udp_port))
+    except KeyboardInterrupt:
+        pass
+
 
-    threading.Thread(target=handle_client,
-                     args=(client1_socket, client2_socket, client_data, peer_client_data, heroes)).start()
+def log_worker_stats(stats):
+    """
+    Log the load summed over all workers.
+
+    Args:
+        stats (dict): Latest report of every worker, keyed by worker number.
+
+    Returns:
+        None
+    """
+    log.info("%d workers: %d connections, %d queued, %d matches running, %d started",
+             len(stats), sum(s["connections"] for s in stats.values()), sum(s["queued"] for s in stats.values()),
+             sum(s["matches"] for s in stats.values()), sum(s["matches_started"] for s in stats.values()))
+    if log.isEnabledFor(logging.DEBUG):
+        for index in sorted(stats):
+            log.debug("Worker %d: %s", index, stats[index])
+
+
+def pair_waiting(procs, waiting):
+    """
+    Pair up lone waiting players of the same bracket that sit on different workers.
+
+    For every two workers reporting a lone player in a bracket, the second
+    is told to hand its player over to the first.
+
+    Args:
+        procs (dict): worker number -> (process, control channel, start time).
+        waiting (dict): worker number -> brackets with a lone waiting player;
+            brackets handed over are removed until the workers report again.
+
+    Returns:
+        None
+    """
+    workers_by_bracket = {}
+    for index in sorted(waiting):
+        for bracket in waiting[index]:
+            workers_by_bracket.setdefault(bracket, []).append(index)
+    for bracket, indices in workers_by_bracket.items():
+        for target, source in zip(indices[::2], indices[1::2]):
+            try:
+                procs[source][1].send({"type": "handoff", "bracket": bracket, "to": target})
+            except OSError:
+                continue  # The worker just died, its exit is handled by the main loop
+            waiting[source].discard(bracket)
+            waiting[target].discard(bracket)
+
+
+def forward_handoff(procs, conn, message):
+    """
+    Receive a connection handed over by a worker and pass it on to its target worker.
+
+    Args:
+        procs (dict): worker number -> (process, control channel, start time).
+        conn (multiprocessing.connection.Connection): Control channel of the handing worker.
+        message (dict): Handoff message; the socket follows it on the channel.
+
+    Returns:
+        None
+    """
+    fd = multiprocessing.reduction.recv_handle(conn)
+    try:
+        target = procs.get(message["to"])
+        if target is None:
+            log.warning("Worker %d is gone, dropping a client handed over to it", message["to"])
+            return
+        proc, target_conn, _ = target
+        target_conn.send({"type": "adopt", "login": message["login"], "pending": message["pending"]})
+        multiprocessing.reduction.send_handle(target_conn, fd, proc.pid)
+    except OSError as e:
+        log.warning("Cannot hand a client over to worker %d: %s", message["to"], e)
+    finally:
+        os.close(fd)
+
+
+def run_supervisor(workers, settings):
+    """
+    Run `workers` server processes on the same port and aggregate their stats.
+
+    On Linux every worker binds its own socket with SO_REUSEPORT and the
+    kernel spreads new connections across them; elsewhere the supervisor opens
+    the listening socket once and hands it to all workers. Each worker reports
+    its load over a pipe every STATS_INTERVAL seconds and, on POSIX systems,
+    which brackets have a player waiting alone; such players are moved between
+    workers so that nobody waits for a partner on another worker forever (see
+    pair_waiting()). Workers that crash are
+    restarted unless they die right after starting. SIGTERM stops the
+    supervisor like Ctrl+C does, terminating the workers first.
+
+    Args:
+        workers (int): Number of worker processes.
+        settings (tuple): Worker settings, see worker_main().
+
+    Returns:
+        None
+    """
+    sock = None
+    if not (sys.platform.startswith("linux") and hasattr(socket, "SO_REUSEPORT")):
+        sock = socket.create_server((SERVER_HOST, SERVER_PORT), backlog=SERVER_BACKLOG)
+
+    procs = {}  # worker number -> (process, control channel, start time)
+    forked = multiprocessing.get_start_method() == "fork"  # Workers get copies of every open pipe end
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt  # Leave through the cleanup below
+
+    def spawn(index):
+        conn, worker_conn = multiprocessing.Pipe()
+        inherited = [conn] + [c for _, c, _ in procs.values()] if forked else []
+        proc = multiprocessing.Process(target=worker_main, args=(index, sock, worker_conn, settings, inherited),
+                                       name=f"arena-worker-{index}", daemon=True)
+        proc.start()
+        worker_conn.close()
+        procs[index] = (proc, conn, time.monotonic())
+
+    signal.signal(signal.SIGTERM, stop)
+    for index in range(workers):
+        spawn(index)
+    log.info("Supervisor started %d workers on %s:%d (%s)", workers, SERVER_HOST, SERVER_PORT,
+             "SO_REUSEPORT" if sock is None else "shared socket")
+
+    stats = {}
+    waiting = {}  # worker number -> brackets with a lone waiting player
+    next_report = time.monotonic() + STATS_INTERVAL
+    try:
+        while procs:
+            channels = {conn: index for index, (_, conn, _) in procs.items()}
+            timeout = max(0.0, next_report - time.monotonic())
+            for conn in multiprocessing.connection.wait(list(channels), timeout):
+                index = channels[conn]
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    message = None
+                if message is not None:
+                    if message["type"] == "waiting":
+                        waiting[index] = set(message["brackets"])
+                        pair_waiting(procs, waiting)
+                    elif message["type"] == "handoff":
+                        forward_handoff(procs, conn, message)
+                    else:
+                        stats[index] = message
+                    continue
+                proc, _, started = procs.pop(index)
+                proc.join()
+                conn.close()
+                stats.pop(index, None)
+                waiting.pop(index, None)
+                if time.monotonic() - started < WORKER_MIN_UPTIME:
+                    log.error("Worker %d exited with code %s right after starting", index, proc.exitcode)
+                else:
+                    log.error("Worker %d exited with code %s, restarting", index, proc.exitcode)
+                    spawn(index)
+            if time.monotonic() >= next_report:
+                next_report = time.monotonic() + STATS_INTERVAL
+                log_worker_stats(stats)
+    except KeyboardInterrupt:
+        log.info("Server stopped.")
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)  # Do not interrupt the cleanup itself
+        for proc, _, _ in procs.values():
+            proc.terminate()
+        for proc, _, _ in procs.values():
+            proc.join()
+        if sock is not None:
+            sock.close()
+
+
+def start_server(tick_rate=TICK_RATE, log_level=None, log_sample=None, match_by=MATCHMAKING,
+                 max_matches=MAX_MATCHES, workers=WORKERS, udp_port=UDP_PORT):
+    """
+    Start the server, wait for client connections, and handle requests.
+
+    Args:
+        tick_rate (int): Simulation steps per second.
+        log_level (str|None): Log level, e.g. "DEBUG" to see every payload.
+        log_sample (int|None): Log one out of every N message payloads at DEBUG level.
+        match_by (str): Matchmaking bracket mode ("any", "hero" or "rating").
+        max_matches (int): Concurrent match limit per process, 0 for no limit.
+        workers (int): Worker processes; more than 1 starts the supervisor mode.
+        udp_port (int): UDP channel port (worker N uses udp_port + N), 0 disables the channel.
+
+    Returns:
+        None
+    """
+    arena_log.setup_logging(log_level)
+    if workers > 1:
+        run_supervisor(workers, (tick_rate, log_level, log_sample, match_by, max_matches, udp_port))
+        return
+    if log_sample:
+        payload_sample.every = log_sample
+    catalog = load_catalog()
+    try:
+        asyncio.run(serve(catalog, tick_rate, match_by, max_matches, udp_port=udp_port))
+    except KeyboardInterrupt:
+        log.info("Server stopped.")
+
+
+def parse_args(argv=None):
+    """
+    Parse command line options.
+
+    Args:
+        argv (list[str]|None): Arguments, defaults to sys.argv[1:].
+
+    Returns:
+        argparse.Namespace: Parsed options.
+    """
+    parser = argparse.ArgumentParser(description="Arena game server")
+    parser.add_argument("--tick-rate", type=int, default=TICK_RATE,
+                        help=f"simulation steps per second (default: {TICK_RATE})")
+    parser.add_argument("--log-level", default=arena_log.DEFAULT_LEVEL,
+                        help="DEBUG, INFO, WARNING or ERROR (default: %(default)s)")
+    parser.add_argument("--log-sample", type=int, default=arena_log.DEFAULT_SAMPLE,
+                        help="log one out of every N message payloads at DEBUG level (default: %(default)s)")
+    parser.add_argument("--match-by", choices=("any", "hero", "rating"), default=MATCHMAKING,
+                        help="pair any players, only players with the same hero, or by rating bracket "
+                             "(default: %(default)s)")
+    parser.add_argument("--max-matches", type=int, default=MAX_MATCHES,
+                        help="concurrent match limit, further players wait in the queue (default: no limit)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="worker processes sharing the port, each hosting its own matches; a player waiting "
+                             "alone is moved to a worker where a partner waits (POSIX only, elsewhere such players "
+                             "may wait forever) (default: %(default)s)")
+    parser.add_argument("--udp-port", type=int, default=UDP_PORT,
+                        help="UDP port for movement updates, worker N uses port + N; 0 keeps everything on TCP "
+                             "(default: %(default)s)")
+    return parser.parse_args(argv)
 
 
 if __name__ == "__main__":
-    start_server()
+    args = parse_args()
+    start_server(args.tick_rate, args.log_level, args.log_sample, args.match_by, args.max_matches, args.workers,
+                 args.udp_port)
@@ -0,0 +1,118 @@
+"""
+Matchmaking queue of server_run: Fenwick-tree positions, removal and capacity.
+
+Run with `python -m pytest tests` from the repository root.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import server_run  # noqa: E402
+
+
+def _players(count, **login):
+    players = [server_run.PlayerState() for _ in range(count)]
+    for i, player in enumerate(players):
+        player.login = dict(login)
+        player.hero_name = f"hero{i}"
+    return players
+
+
+def _matchmaker(monkeypatch, max_matches=0, mode="any"):
+    """Matchmaker whose pairs and queue reports are recorded instead of sent."""
+    pairs = []
+    monkeypatch.setattr(server_run, "send_message", lambda player, message: None)
+    return server_run.Matchmaker(lambda client, peer: pairs.append((client, peer)), mode, max_matches), pairs
+
+
+def test_positions_after_players_in_the_middle_leave():
+    bucket = server_run._QueueBucket()
+    players = _players(10)
+    for player in players:
+        bucket.push(player)
+    assert [bucket.position(p) for p in players] == list(range(1, 11))
+
+    for gone in (players[2], players[5], players[6]):
+        bucket.remove(gone)
+    waiting = [p for i, p in enumerate(players) if i not in (2, 5, 6)]
+    assert [bucket.position(p) for p in waiting] == list(range(1, 8))
+    assert bucket.alive == 7
+
+    late = _players(1)[0]
+    bucket.push(late)
+    assert bucket.position(late) == 8
+
+
+def test_pop_skips_removed_players():
+    bucket = server_run._QueueBucket()
+    players = _players(5)
+    for player in players:
+        bucket.push(player)
+    bucket.remove(players[0])
+    bucket.remove(players[1])
+    bucket.remove(players[3])
+    assert bucket.first() is players[2]
+    assert bucket.pop() is players[2]
+    assert bucket.pop() is players[4]
+    assert bucket.alive == 0
+    assert players[2].ticket == players[4].ticket == 0
+
+
+def test_tickets_restart_when_the_queue_empties():
+    bucket = server_run._QueueBucket()
+    first = _players(3)
+    for player in first:
+        bucket.push(player)
+    for _ in first:
+        bucket.pop()
+    assert bucket.alive == 0
+
+    second = _players(3)
+    for player in second:
+        bucket.push(player)
+    assert len(bucket.tree) == 4  # The tree only covers the new tickets
+    assert [bucket.position(p) for p in second] == [1, 2, 3]
+    bucket.remove(second[0])
+    assert bucket.position(second[2]) == 2
+    assert bucket.pop() is second[1]
+
+
+def test_capacity_comes_back_after_finished(monkeypatch):
+    matchmaker, pairs = _matchmaker(monkeypatch, max_matches=1)
+    a, b, c, d = _players(4)
+    for player in (a, b, c, d):
+        matchmaker.enqueue(player)
+    assert pairs == [(a, b)]
+    assert matchmaker.running == 1
+    assert matchmaker.queued == 2
+    assert c.reported[0] == 1 and d.reported[0] == 2
+
+    matchmaker.finished()
+    assert pairs == [(a, b), (c, d)]
+    assert matchmaker.running == 1
+    assert matchmaker.queued == 0
+    assert not matchmaker.buckets
+
+
+def test_removed_player_is_not_matched(monkeypatch):
+    matchmaker, pairs = _matchmaker(monkeypatch, max_matches=1)
+    a, b, c, d, e = _players(5)
+    for player in (a, b, c, d, e):
+        matchmaker.enqueue(player)
+    matchmaker.remove(c)
+    assert matchmaker.queued == 2
+    matchmaker.report_all()
+    assert d.reported[0] == 1 and e.reported[0] == 2
+
+    matchmaker.finished()
+    assert pairs == [(a, b), (d, e)]
+
+
+def test_rating_brackets(monkeypatch):
+    matchmaker, pairs = _matchmaker(monkeypatch, mode="rating")
+    low, high, low2 = _players(1, rating=1010) + _players(1, rating="1500") + _players(1)
+    for player in (low, high, low2):
+        matchmaker.enqueue(player)
+    assert pairs == [(low, low2)]  # No rating counts as DEFAULT_RATING
+    assert high.ticket and matchmaker.queued == 1
@@ -0,0 +1,109 @@
+"""
+protocol.MessageDecoder on the byte streams a server or client may receive.
+
+Run with `python -m pytest tests` from the repository root.
+"""
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import protocol  # noqa: E402
+
+MOVE = {"opr_type": "1", "hero_x": "120", "hero_y": "-40", "input_seq": "7"}
+ATTACK = {"opr_type": "2", "hero_skill": "1"}
+LOGIN = {"opr_type": "0", "hero_name": "zhaoyun", "wire": protocol.WIRE_VERSION}
+
+
+def _request(data):
+    """Decoded form of a request: every REQUEST_FIELDS key, empty when absent."""
+    decoded = {key: "" for key, _ in protocol.REQUEST_FIELDS}
+    decoded.update(data)
+    return decoded
+
+
+def test_several_messages_in_one_read():
+    stream = protocol.encode_request(MOVE) + protocol.encode_request(ATTACK) + protocol.encode_request(MOVE)
+    decoder = protocol.MessageDecoder()
+    assert decoder.feed(stream) == [_request(MOVE), _request(ATTACK), _request(MOVE)]
+    assert decoder.framed
+    assert decoder.pending() == b""
+
+
+def test_frame_split_across_reads():
+    frame = protocol.encode_request(MOVE)
+    decoder = protocol.MessageDecoder()
+    for i in range(len(frame) - 1):
+        assert decoder.feed(frame[i:i + 1]) == []
+    assert decoder.pending() == frame[:-1]
+    assert decoder.feed(frame[-1:]) == [_request(MOVE)]
+    assert decoder.pending() == b""
+
+
+def test_json_split_across_reads():
+    text = json.dumps(LOGIN).encode("utf-8")
+    decoder = protocol.MessageDecoder()
+    assert decoder.feed(text[:5]) == []
+    assert decoder.feed(text[5:-1]) == []
+    assert decoder.feed(text[-1:]) == [LOGIN]
+    assert not decoder.framed
+
+
+def test_json_and_frames_mixed():
+    stream = (json.dumps(LOGIN).encode("utf-8") + b"\r\n"
+              + protocol.encode_request(MOVE)
+              + protocol.encode_json({"opr_type": "3", "ack": "5"})
+              + b'{"opr_type": "2", "hero_skill": "0"} '
+              + protocol.encode_request(ATTACK))
+    messages = protocol.MessageDecoder().feed(stream)
+    assert messages == [LOGIN, _request(MOVE), {"opr_type": "3", "ack": "5"},
+                        {"opr_type": "2", "hero_skill": "0"}, _request(ATTACK)]
+
+
+def test_mixed_stream_byte_by_byte():
+    stream = b'{"name": "\xc3\xa9"}' + protocol.encode_request(MOVE) + b'{"a": 1}'
+    decoder = protocol.MessageDecoder()
+    messages = []
+    for i in range(len(stream)):
+        messages += decoder.feed(stream[i:i + 1])
+    assert messages == [{"name": "é"}, _request(MOVE), {"a": 1}]
+
+
+def test_buffer_limit():
+    decoder = protocol.MessageDecoder(max_buffer=64)
+    with pytest.raises(ValueError):
+        decoder.feed(b'{"hero_name": "' + b"x" * 100)
+
+
+def test_complete_messages_do_not_count_against_the_limit():
+    frame = protocol.encode_request(MOVE)
+    decoder = protocol.MessageDecoder(max_buffer=len(frame))
+    assert len(decoder.feed(frame * 10)) == 10
+
+
+@pytest.mark.parametrize("stream", [
+    b"\xff\xfe garbage",  # Neither JSON nor a frame
+    b"hello",
+    b"\x00\x00",  # Zero-length frame
+    protocol.encode_json([1, 2]),  # JSON frame that is not an object
+    protocol.pack_frame(protocol.KIND_JSON, b"{not json}"),
+    protocol.pack_frame(protocol.KIND_JSON, b"[" * 5000),
+    protocol.pack_frame(9, b"\x00"),  # Unknown frame kind
+    protocol.pack_frame(protocol.KIND_REQUEST, b"\x01"),  # Truncated record header
+    protocol.pack_frame(protocol.KIND_REQUEST, b"\x01\x00\x00\x00\x03\x00\x00"),  # Mask announces missing fields
+    protocol.pack_frame(protocol.KIND_REQUEST, b"\x01\x00\x00\x00\x01\x20ab"),  # String longer than the frame
+])
+def test_garbage_is_reported_as_value_error(stream):
+    with pytest.raises(ValueError):
+        protocol.MessageDecoder().feed(stream)
+
+
+def test_admit_drops_rejected_requests():
+    stream = (protocol.encode_request(MOVE) + protocol.encode_request(ATTACK)
+              + b'{"opr_type": "2", "hero_skill": "1"}' + b'{"opr_type": "1", "hero_x": "1"}')
+    decoder = protocol.MessageDecoder(admit=lambda opr_type: opr_type == "1")
+    assert decoder.feed(stream) == [_request(MOVE), {"opr_type": "1", "hero_x": "1"}]
+    assert decoder.dropped == 2
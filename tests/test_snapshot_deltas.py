@@ -0,0 +1,83 @@
+"""
+Round trip of delta snapshots: server_run.send_snapshot() -> wire -> clientC.
+
+Run with `python -m pytest tests` from the repository root.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import clientC  # noqa: E402
+import protocol  # noqa: E402
+import server_run  # noqa: E402
+
+
+class _Transport:
+    def get_write_buffer_size(self):
+        return 0
+
+
+class _Writer:
+    transport = _Transport()
+
+
+def _setup(monkeypatch):
+    """One framed player in a match, with the server's sends captured as wire frames."""
+    player, peer = server_run.PlayerState(_Writer()), server_run.PlayerState(_Writer())
+    player.framed = True
+    match = server_run.Match(1, player, peer, None)
+    match.ticks = 1
+    frames = []
+    monkeypatch.setattr(server_run, "send_message", lambda p, message: frames.append(protocol.encode_response(message)))
+    monkeypatch.setattr(clientC, "snapshot_states", {})
+    return match, player, frames
+
+
+def _tick(match, player, frames, state):
+    """Send one tick's snapshot and return it as the client sees it after rebuilding, or None."""
+    count = len(frames)
+    server_run.send_snapshot(match, player, state, "", "")
+    if len(frames) == count:
+        return None
+    decoder = protocol.MessageDecoder()
+    (data,) = decoder.feed(frames[-1])
+    assert clientC.rebuild_snapshot(data)
+    return data
+
+
+def test_field_back_to_acknowledged_value(monkeypatch):
+    match, player, frames = _setup(monkeypatch)
+    first = _tick(match, player, frames, ("100", "100", 10, 10, 150, 20, ""))
+    server_run.acknowledge(player, int(first['seq']))
+
+    moved = _tick(match, player, frames, ("100", "100", 10, 10, 160, 20, ""))
+    assert moved['s_hero2_x'] == "160"
+
+    # Back to the acknowledged value before the client acked the snapshot with 160
+    back = _tick(match, player, frames, ("100", "100", 10, 10, 150, 20, ""))
+    assert back is not None
+    assert back['base_seq'] == first['seq']
+    assert back['s_hero2_x'] == "150"
+    assert back['s_hero2_y'] == "20"
+
+def test_reconcile_after_inputs_cancel_out(monkeypatch):
+    match, player, frames = _setup(monkeypatch)
+    monkeypatch.setattr(clientC, "server_position", None)
+    monkeypatch.setattr(clientC, "character_data", {"x": 100, "y": 50})
+    monkeypatch.setattr(clientC, "input_state", {"sent": (100, 50), "acked": None})
+    monkeypatch.setattr(clientC, "pending_inputs", clientC.deque())
+
+    first = _tick(match, player, frames, ("100", "100", 100, 50, 0, 0, 0))
+    server_run.acknowledge(player, int(first['seq']))
+    clientC.reconcile(first)
+
+    # Input 1 moves +10, input 2 moves -10; both are sent before either is confirmed
+    clientC.pending_inputs.extend([(1, 10, 0), (2, -10, 0)])
+    clientC.character_data["x"] = 100
+    clientC.input_state["sent"] = (100, 50)
+
+    clientC.reconcile(_tick(match, player, frames, ("100", "100", 110, 50, 0, 0, 1)))
+    clientC.reconcile(_tick(match, player, frames, ("100", "100", 100, 50, 0, 0, 2)))
+    assert clientC.character_data["x"] == 100
+    assert not clientC.pending_inputs